@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+
+def record_generation(history, failures):
+    """
+    Appends the best and mean number of failed constraints over a generation's genes to history.
+    """
+    
+    history.append({'best': int(min(failures)), 'mean': float(sum(failures)) / len(failures)})
+
+def stalled(history, generations):
+    """
+    Returns whether no better best gene appeared in the last 'generations' entries of history
+    (never if generations is None).
+    """
+    
+    if generations is None or len(history) <= generations:
+        return False
+    return min(h['best'] for h in history[-generations:]) >= min(h['best'] for h in history[:-generations])
+
+def diversity(genes):
+    """
+    Returns the fraction of distinct genes in a pool, genes being sequences (assignments or interval selections).
+    """
+    
+    return len(set(tuple(g) for g in genes)) / len(genes)
+
+def converged(history, genes, stall_generations=None, diversity_threshold=None):
+    """
+    Returns why the pool converged: 'stalled' if the best gene did not improve for stall_generations generations,
+    'diversity' if the fraction of distinct genes fell below diversity_threshold, or None if it did not.
+    """
+    
+    if stalled(history, stall_generations):
+        return 'stalled'
+    if diversity_threshold is not None and diversity(genes) < diversity_threshold:
+        return 'diversity'
+    return None
@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+from time import monotonic
+
+# result statuses reported by the solvers
+SAT = 'SAT'
+UNSAT = 'UNSAT'
+UNKNOWN = 'UNKNOWN'
+
+def make_deadline(timeout=None, deadline=None):
+    """
+    Returns the absolute deadline (in time.monotonic() seconds) to stop at, or None for no deadline.
+    
+    Arguments:
+    timeout -- seconds from now
+    deadline -- absolute time.monotonic() value, the earlier of both is used
+    """
+    
+    if timeout is not None:
+        deadline = monotonic() + timeout if deadline is None else min(deadline, monotonic() + timeout)
+    return deadline
+
+def expired(deadline, cancel=None):
+    """
+    Returns whether the deadline has passed or the search was cancelled.
+    'cancel' is a cancellation token, anything with an is_set() method (eg. threading.Event or multiprocessing.Event).
+    """
+    
+    return (deadline is not None and monotonic() >= deadline) or \
+           (cancel is not None and cancel.is_set())
@@ -1,8 +1,12 @@
 #!/usr/bin/python3
 
+import numpy as np
+
 from pprint import pprint
 from verifier import verify_witness
 from problem_generator import generate_problem
+from intervals import IntervalSet
+from deadlines import SAT, UNSAT, UNKNOWN, expired, make_deadline
 
 INF = 1e9
 
@@ -16,32 +20,52 @@ def discrete_graph(N):
         mat[i][i] = 0
     return mat
 
-def generate_d_graph(graph):
+def discrete_graph_np(N):
     """
-    Given a distance graph, generates the corresponding d-graph
-    (see R. Dechter - Temporal Constraint Networks)
+    Array-backed version of discrete_graph: an N*N float array with INF entries
+    everywhere except 0 on the leading diagonal.
     """
     
-    N = len(graph)
-    E = discrete_graph(N)
-    
-    for i in range(N):
-        E[i][i] = 0 # redundant
-
-    for i in range(N):
-        for j in range(N):
-            E[i][j] = graph[i][j]
+    mat = np.full((N, N), INF)
+    np.fill_diagonal(mat, 0)
+    return mat
 
-    for k in range(N):
-        for i in range(N):
-            for j in range(N):
-                E[i][j] = min(
-                    E[i][j],
-                    E[i][k] + E[k][j],
-                )
+def generate_d_graph_np(graph):
+    """
+    Given a distance graph as an N*N array, returns the corresponding d-graph as a new array.
+    Vectorized Floyd-Warshall: each k is a single broadcast np.minimum over the whole matrix.
+    (Remark: on inconsistent graphs entries may differ from an in-place close, the diagonal is still negative.)
+    """
+    
+    E = np.array(graph, dtype=float)
+    
+    for k in range(len(E)):
+        np.minimum(E, E[:, k, None] + E[None, k, :], out=E)
+    
+    return E
 
+def generate_d_graphs_np(graphs):
+    """
+    Batched generate_d_graph_np: given a B*N*N stack of distance graphs,
+    returns the B*N*N stack of their d-graphs, closing all of them at once.
+    """
+    
+    E = np.array(graphs, dtype=float)
+    
+    for k in range(E.shape[1]):
+        np.minimum(E, E[:, :, k, None] + E[:, None, k, :], out=E)
+    
     return E
 
+def generate_d_graph(graph):
+    """
+    Given a distance graph, generates the corresponding d-graph
+    (see R. Dechter - Temporal Constraint Networks)
+    (Remark: list of lists wrapper around generate_d_graph_np.)
+    """
+    
+    return generate_d_graph_np(graph).tolist()
+
 def consistent(d_graph):
     """
     Returns whether a d-graph has a consistent solution.
@@ -68,7 +92,167 @@ def get_middles_sol(d_graph):
     """
     return [(-d_graph[i][0] + d_graph[0][i])/2 for i in range(len(d_graph))]
 
-def backtrack(constraints, stats={}, verbose=False):
+def record_best(stats, depth, d_graph, unassigned=None):
+    """
+    Keeps the deepest consistent prefix reached in stats['depth']. Given the 'unassigned' constraints, also keeps
+    the minimal solution of the consistent prefix with the fewest failed constraints seen so far in stats['best']
+    (and their number in stats['best_failures']), the best effort returned when the search runs out of time.
+    Only the unassigned constraints are checked, the assigned ones hold on the d-graph.
+    (Searches pass them only when they have a deadline or cancel, as checking them costs a verification per step.)
+    """
+    
+    if depth > stats['depth']:
+        stats['depth'] = depth
+    if unassigned is None:
+        return
+    
+    X = get_min_sol(d_graph)
+    failures = len(verify_witness(X, unassigned))
+    if stats.get('best') is None or failures < stats['best_failures']:
+        stats['best'] = X
+        stats['best_failures'] = failures
+
+def negative_cycle(N, edges):
+    """
+    Looks for a negative cycle in a sparse distance graph without computing all-pairs shortest paths.
+    Queue-based Bellman-Ford (SPFA) from a virtual source joined to every node with weight 0, O(N*M).
+    Returns None if the graph is consistent, otherwise the list of edges on a negative cycle.
+    
+    Arguments:
+    N -- number of nodes
+    edges -- list of (i, j, weight, label) tuples, each meaning X_j - X_i <= weight
+    """
+    
+    adjacency = [list() for _ in range(N)]
+    for e in edges:
+        adjacency[e[0]].append(e)
+    
+    dist = [0 for _ in range(N)]
+    pred = [None for _ in range(N)] # edge last used to relax each node
+    queue = list(range(N))
+    in_queue = [True for _ in range(N)]
+    rounds = 0
+    
+    while queue:
+        rounds += 1
+        next_queue = []
+        for u in queue:
+            in_queue[u] = False
+            for e in adjacency[u]:
+                v = e[1]
+                if dist[u] + e[2] < dist[v]:
+                    dist[v] = dist[u] + e[2]
+                    pred[v] = e
+                    if not in_queue[v]:
+                        in_queue[v] = True
+                        next_queue.append(v)
+        queue = next_queue
+        
+        # a consistent graph settles within N rounds, past that the predecessors must close a cycle eventually
+        if queue and rounds >= N:
+            cycle = predecessor_cycle(pred)
+            if cycle is not None:
+                return cycle
+    
+    return None
+
+def predecessor_cycle(pred):
+    """
+    Returns the edges of a cycle in the predecessor graph, or None if it is a forest.
+    """
+    
+    state = [0 for _ in range(len(pred))] # 0 unvisited, 1 on current path, 2 done
+    for start in range(len(pred)):
+        path = []
+        v = start
+        while v is not None and state[v] == 0:
+            state[v] = 1
+            path.append(v)
+            v = pred[v][0] if pred[v] is not None else None
+        
+        if v is not None and state[v] == 1:
+            # walk the cycle once more to collect its edges, in order
+            cycle = []
+            u = v
+            while True:
+                cycle.append(pred[u])
+                u = pred[u][0]
+                if u == v: break
+            return cycle[::-1]
+        
+        for u in path:
+            state[u] = 2
+    
+    return None
+
+def selection_edges(constraints, indices, selection):
+    """
+    Returns the distance graph edges of the selected intervals at the given constraint indices,
+    labelled with the constraint index.
+    """
+    
+    edges = []
+    for k in indices:
+        constr = constraints[k]
+        a, b = constr['intervals'][selection[k]]
+        edges.append( (constr['i'], constr['j'], b, k) )
+        edges.append( (constr['j'], constr['i'], -a, k) )
+    return edges
+
+def add_edge(d_graph, i, j, weight, trail=None):
+    """
+    Adds the edge i -> j with the given weight to a consistent d-graph,
+    restoring all-pairs shortest paths in O(N^2) instead of a full O(N^3) close.
+    (incremental APSP, see R. Dechter - Temporal Constraint Networks)
+    Every overwritten entry is pushed onto 'trail' as (a, b, old value) so it can be undone.
+    Returns False, leaving d_graph untouched, if the edge closes a negative cycle.
+    """
+    
+    if weight >= d_graph[i][j]:
+        return True
+    if weight + d_graph[j][i] < 0:
+        return False
+    
+    N = len(d_graph)
+    row_j = d_graph[j]
+    for a in range(N):
+        d_ai = d_graph[a][i]
+        if d_ai >= INF:
+            continue
+        
+        row_a = d_graph[a]
+        via = d_ai + weight
+        for b in range(N):
+            if row_j[b] >= INF:
+                continue
+            if via + row_j[b] < row_a[b]:
+                if trail is not None:
+                    trail.append( (a, b, row_a[b]) )
+                row_a[b] = via + row_j[b]
+    
+    return True
+
+def add_constraint(d_graph, constr, interval, trail=None):
+    """
+    Adds the interval 'interval' of constraint 'constr' to a consistent d-graph.
+    Returns whether the d-graph is still consistent.
+    (Remark: on failure some changes may have been applied already, undo them using the trail.)
+    """
+    
+    i, j = constr['i'], constr['j']
+    return add_edge(d_graph, i, j, interval[1], trail) and \
+           add_edge(d_graph, j, i, -interval[0], trail)
+
+def undo(d_graph, trail, mark):
+    """
+    Reverts all changes recorded on the trail after position 'mark'.
+    """
+    
+    while len(trail) > mark:
+        a, b, value = trail.pop()
+        d_graph[a][b] = value
+
+def backtrack(constraints, stats={}, verbose=False, deadline=None, cancel=None):
     """
     Perform a backtracking search in order to find a solution to a TCSP given by 'constraints'.
     Returns None or a particular valid assignment list.
@@ -77,73 +261,85 @@ def backtrack(constraints, stats={}, verbose=False):
     i = 0
     selection = [None for _ in range(len(constraints))]
     
+    # d_graph always holds the closure of the selections at indices < i,
+    # marks[k] is the trail position before the selection at index k was applied
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    trail = []
+    marks = [0 for _ in range(len(constraints))]
+    
+    anytime = deadline is not None or cancel is not None # only then is a best effort needed
     while 0 <= i < len(constraints):
+        if expired(deadline, cancel):
+            break
         stats['total'] += 1
-        select_value(constraints, i, selection)
+        select_value(constraints, i, selection, d_graph, trail, marks)
         if selection[i] is None:
             stats['dead'] += 1
             stats['backjump'] += 1
             i -= 1
         else:
             i = i + 1
+            record_best(stats, i, d_graph, constraints[i:] if anytime else None)
             if i < len(constraints):
                 selection[i] = None
     
     if i == -1:
+        stats['status'] = UNSAT
         if verbose: print('UNSAT')
         return None
+    elif i < len(constraints):
+        stats['status'] = UNKNOWN
+        if verbose: print('UNKNOWN')
+        return None
     else:
+        stats['status'] = SAT
         stats['consistent'] = 1
-        # turn selection into minimal working example, and return it
-        graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
-        for k, constr in enumerate(constraints):
-            graph[constr['i']][constr['j']] = constr['intervals'][selection[k]][1]
-            graph[constr['j']][constr['i']] = -constr['intervals'][selection[k]][0]
-        d_graph = generate_d_graph(graph)
+        # d_graph is the closure of the whole selection, return its minimal solution
         return get_min_sol(d_graph)
 
-def select_value(constraints, i, selection):
+def select_value(constraints, i, selection, d_graph, trail, marks):
     """
     Make an interval selection at index i.
-    Also updates the list latest to be used for backjumping.
+    Undoes the previous selection at i, and leaves the new one applied on d_graph.
     """
     
     intervals = constraints[i]['intervals']
     
     if selection[i] is None:
         selection[i] = -1
+        marks[i] = len(trail)
     
     while selection[i] + 1 < len(intervals):
+        undo(d_graph, trail, marks[i])
         selection[i] += 1
-        if consistent_selection(constraints, i, selection):
+        if add_constraint(d_graph, constraints[i], intervals[selection[i]], trail):
             return
     
+    undo(d_graph, trail, marks[i])
     selection[i] = None
     
    
 def consistent_selection(constraints, i, selection):
     """
-    Compute whether the assignment selection assigned only at a_j where j <= latest or i == j is consistent.
+    Compute whether the assignment selection assigned only at a_j where j < i or i == j is consistent.
     """
     
-    graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
-    
-    # x_i = a
-    constr = constraints[i]
-    graph[constr['i']][constr['j']] = constr['intervals'][selection[i]][1]
-    graph[constr['j']][constr['i']] = -constr['intervals'][selection[i]][0]
+    return selection_conflict(constraints, i, selection) is None
+
+def selection_conflict(constraints, i, selection):
+    """
+    Same as consistent_selection, but returns the set of constraint indices whose selections
+    form a negative cycle, or None if the selection is consistent.
+    """
     
-    for k in range(i):
-        # a_k-tuple graph
-        constr = constraints[k]
-        graph[constr['i']][constr['j']] = constr['intervals'][selection[k]][1]
-        graph[constr['j']][constr['i']] = -constr['intervals'][selection[k]][0]
-        
-    d_graph = generate_d_graph(graph)
-    return consistent(d_graph)
+    N = max([max(t['i'], t['j']) for t in constraints]) + 1
+    cycle = negative_cycle(N, selection_edges(constraints, range(i+1), selection))
+    if cycle is None:
+        return None
+    return set(e[3] for e in cycle)
 
     
-def backtrack_gbj(constraints, stats={}, verbose=False):
+def backtrack_gbj(constraints, stats={}, verbose=False, deadline=None, cancel=None):
     """
     Perform a backtracking with Gashnic backjumping search in order to find a solution to a TCSP given by 'constraints'.
     Returns None or a particular valid assignment list.
@@ -153,9 +349,16 @@ def backtrack_gbj(constraints, stats={}, verbose=False):
     selection = [None for _ in range(len(constraints))]
     latest = [-1 for _ in range(len(constraints))]
     
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    trail = []
+    marks = [0 for _ in range(len(constraints))]
+    
+    anytime = deadline is not None or cancel is not None # only then is a best effort needed
     while 0 <= i < len(constraints):
+        if expired(deadline, cancel):
+            break
         stats['total'] += 1
-        select_value_gbj(constraints, i, selection, latest)
+        select_value_gbj(constraints, i, selection, latest, d_graph, trail, marks)
         if verbose: print(i)
         if selection[i] is None:
             stats['dead'] += 1
@@ -164,53 +367,48 @@ def backtrack_gbj(constraints, stats={}, verbose=False):
             i = latest[i]
         else:
             i = i + 1
+            record_best(stats, i, d_graph, constraints[i:] if anytime else None)
             if i < len(constraints):
                 selection[i] = None
                 latest[i] = -1
     
     if i == -1:
+        stats['status'] = UNSAT
         if verbose: print('UNSAT')
         return None
+    elif i < len(constraints):
+        stats['status'] = UNKNOWN
+        if verbose: print('UNKNOWN')
+        return None
     else:
+        stats['status'] = SAT
         stats['consistent'] = 1
-        # turn selection into minimal working example, and return it
-        graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
-        for k, constr in enumerate(constraints):
-            graph[constr['i']][constr['j']] = constr['intervals'][selection[k]][1]
-            graph[constr['j']][constr['i']] = -constr['intervals'][selection[k]][0]
-        d_graph = generate_d_graph(graph)
-        return get_min_sol(d_graph)    
+        return get_min_sol(d_graph)
     
 def max_k_consistent_gbj(constraints, i, selection, latest):
     """
-    Compute whether the assignment selection assigned only at a_j where j <= latest or i == j is consistent.
+    Called once the selection at index i is inconsistent with all the selections before it.
+    Finds the shortest prefix a_0..a_k that is inconsistent together with a_i, and updates latest[i] to k.
+    Each prefix only costs an incremental O(N^2) edge addition.
     """
     
-    graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
     
     # x_i = a
     constr = constraints[i]
-    graph[constr['i']][constr['j']] = constr['intervals'][selection[i]][1]
-    graph[constr['j']][constr['i']] = -constr['intervals'][selection[i]][0]
+    if not add_constraint(d_graph, constr, constr['intervals'][selection[i]]):
+        return
     
-    k = 0
-    while k < i:
-        latest[i] = max(latest[i], k)
-        
+    for k in range(i):
         # a_k-tuple graph
         constr = constraints[k]
-        graph[constr['i']][constr['j']] = constr['intervals'][selection[k]][1]
-        graph[constr['j']][constr['i']] = -constr['intervals'][selection[k]][0]
-        
-        d_graph = generate_d_graph(graph)
-        if not consistent(d_graph):
-            return False
-        else:
-            k += 1
+        if not add_constraint(d_graph, constr, constr['intervals'][selection[k]]):
+            latest[i] = max(latest[i], k)
+            return
     
-    return True
+    latest[i] = max(latest[i], i - 1)
 
-def select_value_gbj(constraints, i, selection, latest):
+def select_value_gbj(constraints, i, selection, latest, d_graph, trail, marks):
     """
     Make an interval selection at index i.
     Also updates the list latest to be used for backjumping.
@@ -220,14 +418,480 @@ def select_value_gbj(constraints, i, selection, latest):
     
     if selection[i] is None:
         selection[i] = -1
+        marks[i] = len(trail)
     
     while selection[i] + 1 < len(intervals):
+        undo(d_graph, trail, marks[i])
         selection[i] += 1
-        if max_k_consistent_gbj(constraints, i, selection, latest):
+        if add_constraint(d_graph, constraints[i], intervals[selection[i]], trail):
+            latest[i] = max(latest[i], i - 1)
             return
+        max_k_consistent_gbj(constraints, i, selection, latest)
     
+    undo(d_graph, trail, marks[i])
     selection[i] = None
     
+def backtrack_cbj(constraints, stats={}, verbose=False, max_nogoods=1000, deadline=None, cancel=None):
+    """
+    Perform a backtracking search with conflict-directed backjumping and nogood learning
+    in order to find a solution to a TCSP given by 'constraints'.
+    Returns None or a particular valid assignment list.
+    
+    conflicts[i] is the set of earlier indices whose selections rule out values at index i,
+    taken from the negative cycles found when the values fail.
+    On a dead end the selections at conflicts[i] are learned as a nogood, and the search jumps
+    to the deepest index in conflicts[i].
+    """
+    
+    i = 0
+    selection = [None for _ in range(len(constraints))]
+    conflicts = [set() for _ in range(len(constraints))]
+    nogoods = nogood_store(max_nogoods)
+    
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    trail = []
+    marks = [0 for _ in range(len(constraints))]
+    
+    stats['learned'] = 0 # number of nogoods learned
+    stats['evicted'] = 0 # number of nogoods evicted from the store
+    stats['pruned'] = 0 # number of values pruned by a nogood
+    
+    anytime = deadline is not None or cancel is not None # only then is a best effort needed
+    while 0 <= i < len(constraints):
+        if expired(deadline, cancel):
+            break
+        stats['total'] += 1
+        select_value_cbj(constraints, i, selection, conflicts, nogoods, d_graph, trail, marks, stats)
+        if selection[i] is None:
+            stats['dead'] += 1
+            h = max(conflicts[i]) if conflicts[i] else -1
+            if h >= 0:
+                learn_nogood(nogoods, [(k, selection[k]) for k in conflicts[i]], stats)
+                conflicts[h] |= conflicts[i] - {h}
+            
+            stats['backjump'] += i - h
+            if verbose: print('jumping', i, h)
+            for k in range(h+1, i+1):
+                conflicts[k] = set()
+            i = h
+        else:
+            i = i + 1
+            record_best(stats, i, d_graph, constraints[i:] if anytime else None)
+            if i < len(constraints):
+                selection[i] = None
+    
+    if i == -1:
+        stats['status'] = UNSAT
+        if verbose: print('UNSAT')
+        return None
+    elif i < len(constraints):
+        stats['status'] = UNKNOWN
+        if verbose: print('UNKNOWN')
+        return None
+    else:
+        stats['status'] = SAT
+        stats['consistent'] = 1
+        return get_min_sol(d_graph)
+
+def select_value_cbj(constraints, i, selection, conflicts, nogoods, d_graph, trail, marks, stats):
+    """
+    Make an interval selection at index i.
+    Every rejected value adds the indices that explain its rejection to conflicts[i].
+    """
+    
+    intervals = constraints[i]['intervals']
+    
+    if selection[i] is None:
+        selection[i] = -1
+        marks[i] = len(trail)
+    
+    while selection[i] + 1 < len(intervals):
+        undo(d_graph, trail, marks[i])
+        selection[i] += 1
+        
+        culprits = nogood_conflict(nogoods, i, selection)
+        if culprits is not None:
+            stats['pruned'] += 1
+            conflicts[i] |= culprits
+            continue
+        
+        if add_constraint(d_graph, constraints[i], intervals[selection[i]], trail):
+            return
+        
+        # the prefix before i is consistent, so the cycle goes through i
+        conflicts[i] |= selection_conflict(constraints, i, selection) - {i}
+    
+    undo(d_graph, trail, marks[i])
+    selection[i] = None
+
+def nogood_store(capacity):
+    """
+    Returns an empty bounded nogood store with least recently used eviction.
+    A nogood is a frozenset of (constraint index, interval index) pairs that cannot appear together,
+    it is indexed by the pair at its deepest constraint index.
+    """
+    
+    from collections import OrderedDict
+    return {'capacity': capacity, 'order': OrderedDict(), 'index': {}}
+
+def learn_nogood(nogoods, pairs, stats):
+    """
+    Adds a nogood to the store, evicting the least recently used one if it is full.
+    """
+    
+    nogood = frozenset(pairs)
+    if nogood in nogoods['order']:
+        nogoods['order'].move_to_end(nogood)
+        return
+    
+    key = max(nogood)
+    nogoods['order'][nogood] = key
+    nogoods['index'].setdefault(key, []).append(nogood)
+    stats['learned'] += 1
+    
+    if len(nogoods['order']) > nogoods['capacity']:
+        old, old_key = nogoods['order'].popitem(last=False)
+        nogoods['index'][old_key].remove(old)
+        if not nogoods['index'][old_key]:
+            del nogoods['index'][old_key]
+        stats['evicted'] += 1
+
+def nogood_conflict(nogoods, i, selection):
+    """
+    Returns the other indices of a stored nogood violated by the selection at index i
+    (together with the selections before it), or None if there is none.
+    """
+    
+    for nogood in nogoods['index'].get((i, selection[i]), ()):
+        if all(selection[k] == value for k, value in nogood):
+            nogoods['order'].move_to_end(nogood)
+            return set(k for k, _ in nogood if k != i)
+    return None
+
+def remaining_intervals(d_graph, constr):
+    """
+    Returns the indices of the intervals of constr that are consistent with a consistent d-graph,
+    ie. that intersect the bounds [-d_graph[j][i], d_graph[i][j]] it implies on X_j - X_i.
+    """
+    
+    i, j = constr['i'], constr['j']
+    low, high = -d_graph[j][i], d_graph[i][j]
+    return [
+        k for k, (a, b) in enumerate(constr['intervals'])
+        if max(a, low) <= min(b, high)
+    ]
+
+def constraint_degrees(constraints):
+    """
+    Returns for every constraint the number of constraints sharing a variable with it.
+    """
+    
+    num_variables = max([max(t['i'], t['j']) for t in constraints]) + 1
+    variable_degree = [0 for _ in range(num_variables)]
+    for constr in constraints:
+        variable_degree[constr['i']] += 1
+        variable_degree[constr['j']] += 1
+    
+    return [variable_degree[c['i']] + variable_degree[c['j']] - 2 for c in constraints]
+
+def pick_constraint_mrv(constraints, unassigned, d_graph, degree):
+    """
+    Picks the unassigned constraint with the fewest intervals left after forward checking
+    against d_graph, breaking ties by the largest degree in the constraint graph.
+    """
+    
+    return min(
+        unassigned,
+        key=lambda k: (len(remaining_intervals(d_graph, constraints[k])), -degree[k], k)
+    )
+
+def order_values_slack(constr, d_graph):
+    """
+    Returns the intervals of constr consistent with d_graph, the ones leaving the most slack first.
+    (slack is the length of the interval once tightened to the d-graph bounds)
+    """
+    
+    i, j = constr['i'], constr['j']
+    low, high = -d_graph[j][i], d_graph[i][j]
+    intervals = constr['intervals']
+    return sorted(
+        remaining_intervals(d_graph, constr),
+        key=lambda k: max(low, intervals[k][0]) - min(high, intervals[k][1])
+    )
+
+def backtrack_dynamic(constraints, stats={}, verbose=False,
+                      pick_constraint=pick_constraint_mrv,
+                      order_values=order_values_slack,
+                      deadline=None, cancel=None):
+    """
+    Perform a backtracking search with dynamic constraint and interval ordering
+    in order to find a solution to a TCSP given by 'constraints'.
+    Returns None or a particular valid assignment list.
+    
+    Arguments:
+    pick_constraint -- (constraints, unassigned indices, d_graph, degrees) -> index of the constraint to assign next
+    order_values -- (constraint, d_graph) -> list of interval indices to try, in order
+    """
+    
+    level = 0
+    order = [None for _ in range(len(constraints))] # constraint index assigned at each level
+    values = [None for _ in range(len(constraints))] # interval indices to try at each level
+    position = [0 for _ in range(len(constraints))]
+    unassigned = set(range(len(constraints)))
+    degree = constraint_degrees(constraints)
+    
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    trail = []
+    marks = [0 for _ in range(len(constraints))]
+    
+    anytime = deadline is not None or cancel is not None # only then is a best effort needed
+    while 0 <= level < len(constraints):
+        if expired(deadline, cancel):
+            break
+        stats['total'] += 1
+        if order[level] is None:
+            k = pick_constraint(constraints, unassigned, d_graph, degree)
+            unassigned.remove(k)
+            order[level] = k
+            values[level] = order_values(constraints[k], d_graph)
+            position[level] = -1
+            marks[level] = len(trail)
+        
+        k = order[level]
+        intervals = constraints[k]['intervals']
+        found = False
+        while position[level] + 1 < len(values[level]):
+            undo(d_graph, trail, marks[level])
+            position[level] += 1
+            if add_constraint(d_graph, constraints[k], intervals[values[level][position[level]]], trail):
+                found = True
+                break
+        
+        if found:
+            level += 1
+            record_best(stats, level, d_graph, [constraints[k] for k in unassigned] if anytime else None)
+        else:
+            undo(d_graph, trail, marks[level])
+            stats['dead'] += 1
+            stats['backjump'] += 1
+            unassigned.add(k)
+            order[level] = None
+            level -= 1
+    
+    if level == -1:
+        stats['status'] = UNSAT
+        if verbose: print('UNSAT')
+        return None
+    elif level < len(constraints):
+        stats['status'] = UNKNOWN
+        if verbose: print('UNKNOWN')
+        return None
+    else:
+        stats['status'] = SAT
+        stats['consistent'] = 1
+        return get_min_sol(d_graph)
+
+def backtrack_fc(constraints, stats={}, verbose=False, deadline=None, cancel=None):
+    """
+    Perform a backtracking search with forward checking in order to find a solution to a TCSP given by 'constraints'.
+    Returns None or a particular valid assignment list.
+    
+    After each selection, the intervals of every later constraint are clipped to the bounds
+    the d-graph implies on it. An empty domain rejects the selection straight away.
+    """
+    
+    i = 0
+    selection = [None for _ in range(len(constraints))]
+    domains = [list(constr['intervals']) for constr in constraints]
+    
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    trail = []
+    marks = [0 for _ in range(len(constraints))]
+    domain_trail = []
+    domain_marks = [0 for _ in range(len(constraints))]
+    
+    anytime = deadline is not None or cancel is not None # only then is a best effort needed
+    while 0 <= i < len(constraints):
+        if expired(deadline, cancel):
+            break
+        stats['total'] += 1
+        select_value_fc(constraints, i, selection, domains, d_graph, trail, marks, domain_trail, domain_marks)
+        if selection[i] is None:
+            stats['dead'] += 1
+            stats['backjump'] += 1
+            i -= 1
+        else:
+            i = i + 1
+            record_best(stats, i, d_graph, constraints[i:] if anytime else None)
+            if i < len(constraints):
+                selection[i] = None
+    
+    if i == -1:
+        stats['status'] = UNSAT
+        if verbose: print('UNSAT')
+        return None
+    elif i < len(constraints):
+        stats['status'] = UNKNOWN
+        if verbose: print('UNKNOWN')
+        return None
+    else:
+        stats['status'] = SAT
+        stats['consistent'] = 1
+        return get_min_sol(d_graph)
+
+def select_value_fc(constraints, i, selection, domains, d_graph, trail, marks, domain_trail, domain_marks):
+    """
+    Make an interval selection at index i out of its filtered domain, and filter the domains after it.
+    Undoes the previous selection at i (and its filtering) first.
+    """
+    
+    if selection[i] is None:
+        selection[i] = -1
+        marks[i] = len(trail)
+        domain_marks[i] = len(domain_trail)
+    
+    while selection[i] + 1 < len(domains[i]):
+        undo(d_graph, trail, marks[i])
+        undo_domains(domains, domain_trail, domain_marks[i])
+        selection[i] += 1
+        if add_constraint(d_graph, constraints[i], domains[i][selection[i]], trail) and \
+           forward_check(constraints, i, domains, d_graph, domain_trail):
+            return
+    
+    undo(d_graph, trail, marks[i])
+    undo_domains(domains, domain_trail, domain_marks[i])
+    selection[i] = None
+
+def forward_check(constraints, i, domains, d_graph, domain_trail):
+    """
+    Clips each interval in the domains of the constraints after index i to the bounds [-d_graph[j][i], d_graph[i][j]],
+    dropping the empty ones (without merging, so the domain intervals stay those of the constraint).
+    Old domains are pushed onto domain_trail as (index, domain).
+    Returns False as soon as a domain becomes empty.
+    """
+    
+    for k in range(i+1, len(constraints)):
+        a, b = constraints[k]['i'], constraints[k]['j']
+        low, high = -d_graph[b][a], d_graph[a][b]
+        domain = [(max(l, low), min(r, high)) for l, r in domains[k] if max(l, low) <= min(r, high)]
+        if domain != domains[k]:
+            domain_trail.append( (k, domains[k]) )
+            domains[k] = domain
+            if not domain:
+                return False
+    
+    return True
+
+def undo_domains(domains, domain_trail, mark):
+    """
+    Restores the domains recorded on the trail after position 'mark'.
+    """
+    
+    while len(domain_trail) > mark:
+        k, domain = domain_trail.pop()
+        domains[k] = domain
+
+def all_selections(constraints):
+    """
+    Lazily enumerates every consistent interval selection of the TCSP given by 'constraints'.
+    Yields lists where selection[k] is the index of the interval picked for constraints[k].
+    """
+    
+    order = sorted(range(len(constraints)), key=lambda k: len(constraints[k]['intervals']))
+    c2 = [constraints[k] for k in order]
+    if not c2:
+        return
+    
+    i = 0
+    selection = [None for _ in range(len(c2))]
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in c2]) + 1)
+    trail = []
+    marks = [0 for _ in range(len(c2))]
+    
+    while i >= 0:
+        if i == len(c2):
+            result = [None for _ in range(len(c2))]
+            for k, original in enumerate(order):
+                result[original] = selection[k]
+            yield result
+            i -= 1
+            continue
+        
+        select_value(c2, i, selection, d_graph, trail, marks)
+        if selection[i] is None:
+            i -= 1
+        else:
+            i = i + 1
+            if i < len(c2):
+                selection[i] = None
+
+def minimal_network(constraints, stats={}, max_memo=10000):
+    """
+    Computes the minimal network of the TCSP given by 'constraints': for every pair of variables i < j,
+    the union over all consistent selections of the values X_j - X_i can take.
+    Returns the network in the same form as the constraints (like preprocessing.PC_1), or None if unsatisfiable.
+    
+    Subtrees are memoized on (depth, d-graph): two prefixes with the same closure have the same completions,
+    so a repeated closure is never searched (nor closed) again. The memo keeps the max_memo most recently used
+    subtrees, keyed by a 128-bit digest of the d-graph. stats has its 'memo_hits', 'memo_misses' and 'memo_hit_rate'.
+    """
+    
+    from collections import OrderedDict
+    from hashlib import blake2b
+    
+    c2 = sorted(constraints, key=lambda l: len(l['intervals']))
+    N = max([max(t['i'], t['j']) for t in c2]) + 1
+    d_graph = discrete_graph(N)
+    memo = OrderedDict() # (depth, d-graph digest) -> whether the subtree has a solution
+    network = [[set() for j in range(N)] for i in range(N)]
+    unbounded = set() # pairs left unbounded by some solution
+    stats['total'] = 0
+    stats['memo_hits'] = 0
+    stats['memo_misses'] = 0
+    stats['solutions'] = 0
+    
+    def search(depth):
+        key = (depth, blake2b(np.array(d_graph).tobytes(), digest_size=16).digest())
+        if key in memo:
+            stats['memo_hits'] += 1
+            memo.move_to_end(key)
+            return memo[key]
+        stats['memo_misses'] += 1
+        stats['total'] += 1
+        
+        if depth == len(c2):
+            stats['solutions'] += 1
+            for i in range(N):
+                for j in range(i+1, N):
+                    if d_graph[i][j] < INF and d_graph[j][i] < INF:
+                        network[i][j].add( (-d_graph[j][i], d_graph[i][j]) )
+                    else:
+                        unbounded.add( (i, j) )
+            found = True
+        else:
+            found = False
+            trail = []
+            for interval in c2[depth]['intervals']:
+                if add_constraint(d_graph, c2[depth], interval, trail):
+                    found = search(depth + 1) or found
+                undo(d_graph, trail, 0)
+        
+        memo[key] = found
+        if len(memo) > max_memo:
+            memo.popitem(last=False)
+        return found
+    
+    found = search(0)
+    stats['memo_hit_rate'] = stats['memo_hits'] / (stats['memo_hits'] + stats['memo_misses'])
+    if not found:
+        return None
+    
+    return [
+        {'i': i, 'j': j, 'intervals': IntervalSet(network[i][j]).to_list()}
+        for i in range(N) for j in range(i+1, N)
+        if network[i][j] and (i, j) not in unbounded
+    ]
+
 def solve_stp(graph):
     """
     Given adjacency matrix solve simple temporal problem.
@@ -237,22 +901,108 @@ def solve_stp(graph):
     d_graph = generate_d_graph(graph)
     return consistent(d_graph), get_min_sol(d_graph)
 
-def solve(constraints, backjump=True, stats={}, verbose=False):
+def restrict_to_network(constraints, network):
+    """
+    Returns the constraints with their intervals intersected with the labels of a preprocessed network,
+    followed by the network labels on the other pairs, or None if an intersection is empty.
+    Preprocessing merges intervals less than 1 apart, so its labels only over-approximate the constraints:
+    the intersection keeps the constraints' exact meaning, and solutions found on it satisfy them.
+    """
+    
+    labels = {}
+    for constr in network:
+        i, j = constr['i'], constr['j']
+        if i != j:
+            labels[(i, j)] = constr['intervals']
+    
+    ret = []
+    for constr in constraints:
+        i, j = constr['i'], constr['j']
+        if (i, j) in labels:
+            label = IntervalSet(labels.pop((i, j)))
+        elif (j, i) in labels:
+            label = IntervalSet(labels.pop((j, i))).reverse()
+        else:
+            ret.append(constr)
+            continue
+        
+        intervals = IntervalSet(constr['intervals']).intersect(label).to_list()
+        if not intervals:
+            return None
+        ret.append({**constr, 'intervals': intervals})
+    
+    for (i, j), intervals in labels.items():
+        ret.append({'i': i, 'j': j, 'intervals': list(intervals)})
+    
+    return ret
+
+def solve(constraints, backjump=True, stats={}, verbose=False, strategy=None, max_nogoods=1000,
+          pick_constraint=pick_constraint_mrv, order_values=order_values_slack,
+          timeout=None, deadline=None, cancel=None, preprocess=None):
     """
     Solve the general TCSP given by 'constraints'.
     Returns a valid assignment X or None.
     Fills in the "stats" dict if provided.
+    stats['status'] is 'SAT', 'UNSAT', or 'UNKNOWN' if the search was stopped early,
+    in which case stats['best'] holds the minimal solution of the consistent prefix reached
+    with the fewest failed constraints, and stats['best_failed'] the constraints it fails
+    (they are only tracked given a timeout, deadline or cancel, otherwise they are None).
+    
+    Arguments:
+    constraints -- the constraint problem
+    backjump -- shorthand for strategy='gbj' (True) or strategy='bt' (False)
+    strategy -- 'bt' backtracking, 'gbj' Gaschnig backjumping, 'cbj' conflict-directed backjumping with nogood learning,
+                'dynamic' backtracking with dynamic constraint/interval ordering, 'fc' backtracking with forward checking
+    max_nogoods -- size of the nogood store used by 'cbj'
+    pick_constraint, order_values -- ordering heuristics used by 'dynamic', see backtrack_dynamic
+    timeout -- seconds after which to stop searching
+    deadline -- absolute time.monotonic() value at which to stop searching
+    cancel -- cancellation token, the search stops once cancel.is_set()
+    preprocess -- optional constraint propagation run before the search, eg. preprocessing.PC_2
+                  (preprocessing assumes integer solutions, so its network is only used to prune the original
+                   constraints, see restrict_to_network)
     """
     
+    if strategy is None:
+        strategy = 'gbj' if backjump else 'bt'
+    deadline = make_deadline(timeout, deadline)
+    
     stats['total'] = 0 # total nodes/intervals searched
     stats['consistent'] = 0 # number of consistent ends found
     stats['dead'] = 0 # number of dead ends
     stats['backjump'] = 0 # sum of all backjump distances, divide by deadends to find avg backjump length
+    stats['status'] = UNKNOWN
+    stats['depth'] = 0 # deepest consistent prefix reached
+    stats['best'] = None
+    stats['best_failures'] = None # number of constraints stats['best'] fails
     
     from copy import deepcopy
     c2 = deepcopy(constraints)
+    if preprocess is not None:
+        network = preprocess(deepcopy(constraints))
+        c2 = None if network is None else restrict_to_network(c2, network)
+        if c2 is None:
+            stats['status'] = UNSAT
+            stats['best_failed'] = None
+            if verbose: print('UNSAT')
+            return None
+    
     c2.sort(key=lambda l: len(l['intervals']))
-    if backjump:
-        return backtrack_gbj(c2, stats=stats, verbose=verbose)
+    if strategy == 'gbj':
+        X = backtrack_gbj(c2, stats=stats, verbose=verbose, deadline=deadline, cancel=cancel)
+    elif strategy == 'bt':
+        X = backtrack(c2, stats=stats, verbose=verbose, deadline=deadline, cancel=cancel)
+    elif strategy == 'cbj':
+        X = backtrack_cbj(c2, stats=stats, verbose=verbose, max_nogoods=max_nogoods,
+                          deadline=deadline, cancel=cancel)
+    elif strategy == 'fc':
+        X = backtrack_fc(c2, stats=stats, verbose=verbose, deadline=deadline, cancel=cancel)
+    elif strategy == 'dynamic':
+        X = backtrack_dynamic(c2, stats=stats, verbose=verbose,
+                              pick_constraint=pick_constraint, order_values=order_values,
+                              deadline=deadline, cancel=cancel)
     else:
-        return backtrack(c2, stats=stats, verbose=verbose)
+        raise ValueError(f'unknown strategy: {strategy}')
+    
+    stats['best_failed'] = None if stats['best'] is None else verify_witness(stats['best'], constraints)
+    return X
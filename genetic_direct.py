@@ -1,7 +1,12 @@
-from random import randint, uniform
+import numpy as np
+
+from random import choice, randint, random, uniform
 
 from problem_generator import generate_problem
-from verifier import verify_witness
+from verifier import compile_problem, verify_batch, verify_witness
+from intervals import IntervalSet
+from deadlines import SAT, UNKNOWN, expired, make_deadline
+from convergence import converged, record_generation
 
 
 def random_gene(T, r):
@@ -14,14 +19,16 @@ def sweep_line(intervals):
     Given a list of intervals, returns a pair consisting of:
       1) the number of unsatisfied intervals
       2) the midpoint of a maximal number of unsatisfied overlapping intervals
+         (truncated to an integer when that stays inside them)
     """
     
     L = []
     for l, r in intervals:
         L.append( (l, 1) )
         L.append( (r, -1) )
-        
-    L.sort(key=lambda a: 10*a[0] - a[1])
+    
+    # starts before ends at the same point, since intervals are closed
+    L.sort(key=lambda a: (a[0], -a[1]))
     
     c = 0
     top = -1
@@ -33,12 +40,57 @@ def sweep_line(intervals):
             top = c
             top_index = index
     
-    sol = int( (L[top_index][0] + L[top_index+1][0])/2 )
+    a, b = L[top_index][0], L[top_index+1][0]
+    sol = (a + b)/2
+    if a <= int(sol) <= b:
+        sol = int(sol)
     
     # returns the number of intervals unsatisfied and time point
     return len(intervals) - top, sol
 
-def walk_gene(gene, T, pick_best_gene=True):
+def sweep_lines(owners, lows, highs, num_owners):
+    """
+    sweep_line for many variables at once: interval k is [lows[k], highs[k]] and belongs to variable owners[k].
+    Returns two arrays over range(num_owners): the number of unsatisfied intervals and the best point
+    (as in sweep_line, nan for variables without intervals).
+    """
+    
+    counts = np.bincount(owners, minlength=num_owners)
+    best = np.full(num_owners, np.nan)
+    if len(owners) == 0:
+        return counts, best
+    
+    points = np.concatenate([lows, highs])
+    increments = np.concatenate([np.ones(len(lows), dtype=int), -np.ones(len(highs), dtype=int)])
+    events = np.concatenate([owners, owners])
+    
+    # by variable, then point, starts before ends
+    order = np.lexsort((-increments, points, events))
+    points, events = points[order], events[order]
+    # the events of a variable sum to 0, so the running sum restarts at every variable
+    coverage = np.cumsum(increments[order])
+    
+    starts = np.flatnonzero(np.r_[True, events[1:] != events[:-1]])
+    top = np.maximum.reduceat(coverage, starts)
+    group = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(events)]))
+    
+    # first event of each variable reaching its top
+    at_top = np.flatnonzero(coverage == top[group])
+    at_top = at_top[np.r_[True, group[at_top][1:] != group[at_top][:-1]]]
+    
+    a, b = points[at_top], points[at_top + 1]
+    sol = (a + b)/2
+    truncated = np.trunc(sol)
+    sol = np.where((a <= truncated) & (truncated <= b), truncated, sol)
+    
+    variables = events[starts]
+    unsatisfied = counts.copy()
+    unsatisfied[variables] -= top
+    best[variables] = sol
+    
+    return unsatisfied, best
+
+def walk_gene(gene, T, pick_best_gene=True, compiled=None):
     """
     Walk a gene toward a more locally optimal assignment.
     
@@ -47,8 +99,12 @@ def walk_gene(gene, T, pick_best_gene=True):
     T -- constraint problem
     pick_best_gene -- whether to pick a random gene and assign it an optimal value, 
                       or attempt all genes and find the best improvement
+    compiled -- optional compile_problem(T), to reuse across calls
     """
     
+    if pick_best_gene:
+        return walk_gene_best(gene, T, compiled)
+    
     num_variables = max([max(t['i'], t['j']) for t in T])
     
     constraints_per_variable = [list() for i in range(num_variables + 1)]
@@ -78,25 +134,182 @@ def walk_gene(gene, T, pick_best_gene=True):
     # for now: pick a random variable and modify it according to sweep_line
     # if no later, then we can make the loop upstairs simpler (to only do stuff if "i" is mentioned)
 
-    if pick_best_gene:
-        reduction = -1
-        best_gene = -1
-        new_gene_base = 0
-        for i in range(1, num_variables+1):
-            faileds = failed_per_variable[i]
-            new_faileds, new_gene_base = sweep_line(constraints_per_variable[i])
-            
-            if faileds - new_faileds >= reduction: #important to have \geq so it doesnt get stuck on 1 if 1 is best
-                reduction = faileds - new_faileds
-                best_gene = i
-                best_gene_base = new_gene_base
-        gene[best_gene] = best_gene_base
-    else:
-        i = randint(1, num_variables)
-        gene[i] = sweep_line(constraints_per_variable[i])[1]
+    i = randint(1, num_variables)
+    gene[i] = sweep_line(constraints_per_variable[i])[1]
         
     return gene
 
+def walk_gene_best(gene, T, compiled=None):
+    """
+    walk_gene with pick_best_gene, with all variables' availability intervals built and swept at once.
+    """
+    
+    if compiled is None:
+        compiled = compile_problem(T)
+    num_variables = max([max(t['i'], t['j']) for t in T])
+    
+    x = np.asarray(gene, dtype=float)
+    rows, cols = np.nonzero(compiled['lows'] <= compiled['highs']) # drop padding
+    i, j = compiled['i'][rows], compiled['j'][rows]
+    l, r = compiled['lows'][rows, cols], compiled['highs'][rows, cols]
+    
+    # X_i in [X_j - r, X_j - l] and X_j in [X_i + l, X_i + r]
+    owners = np.concatenate([i, j])
+    lows = np.concatenate([x[j] - r, x[i] + l])
+    highs = np.concatenate([x[j] - l, x[i] + r])
+    
+    failed = (x[j] - x[i] < l) | (x[j] - x[i] > r)
+    failed_per_variable = np.bincount(i, weights=failed, minlength=num_variables+1) \
+                        + np.bincount(j, weights=failed, minlength=num_variables+1)
+    
+    unsatisfied, best = sweep_lines(owners, lows, highs, num_variables+1)
+    
+    # last best reduction, so it doesnt get stuck on 1 if 1 is best (like >= in walk_gene)
+    reduction = (failed_per_variable - unsatisfied)[1:]
+    v = num_variables - int(np.argmax(reduction[::-1]))
+    if not np.isnan(best[v]):
+        gene[v] = int(best[v]) if best[v].is_integer() else float(best[v])
+    
+    return gene
+
+def incidence(T):
+    """ Returns, for each variable, the indices of the constraints on it. """
+    
+    num_variables = max([max(t['i'], t['j']) for t in T])
+    index = [list() for _ in range(num_variables + 1)]
+    for k, c in enumerate(T):
+        index[c['i']].append(k)
+        if c['j'] != c['i']:
+            index[c['j']].append(k)
+    return index
+
+def satisfied(c, gene):
+    """ Returns whether the assignment 'gene' satisfies constraint c. """
+    
+    diff = gene[c['j']] - gene[c['i']]
+    return any(l <= diff <= r for l, r in c['intervals'])
+
+def walk_state(gene, T, index=None):
+    """
+    Returns a persistent local search state for 'gene', so single variable changes can be applied in O(degree).
+    The state is a dict with:
+      'gene' -- the assignment, modified in place
+      'index' -- constraints per variable (see incidence)
+      'intervals' -- for each constraint, its intervals with touching ones merged, so a value of a variable
+                     lies in at most one interval per constraint
+      'satisfied' -- for each constraint, whether it is satisfied
+      'failed_per_variable' -- for each variable, the number of failed constraints on it
+      'num_failed' -- the total number of failed constraints
+      'moves' -- for each variable, the cached sweep_line result (or None if a neighbour changed)
+    """
+    
+    if index is None:
+        index = incidence(T)
+    
+    state = {
+        'gene': gene,
+        'index': index,
+        'intervals': [IntervalSet(c['intervals']).to_list() for c in T],
+        'satisfied': [satisfied(c, gene) for c in T],
+        'failed_per_variable': [0 for _ in index],
+        'num_failed': 0,
+        'moves': [None for _ in index],
+    }
+    
+    for v, ks in enumerate(index):
+        state['failed_per_variable'][v] = sum(1 for k in ks if not state['satisfied'][k])
+    state['num_failed'] = state['satisfied'].count(False)
+    
+    return state
+
+def assign(state, T, v, value):
+    """
+    Sets X_v = value in the state, only re-checking the constraints on v.
+    """
+    
+    gene = state['gene']
+    gene[v] = value
+    
+    for k in state['index'][v]:
+        c = T[k]
+        now = satisfied(c, gene)
+        if now == state['satisfied'][k]:
+            continue
+        
+        change = -1 if now else 1
+        state['satisfied'][k] = now
+        state['num_failed'] += change
+        state['failed_per_variable'][c['i']] += change
+        if c['j'] != c['i']:
+            state['failed_per_variable'][c['j']] += change
+    
+    # best moves of v and its neighbours depend on X_v
+    state['moves'][v] = None
+    for k in state['index'][v]:
+        state['moves'][T[k]['i']] = None
+        state['moves'][T[k]['j']] = None
+
+def best_move(state, T, v):
+    """
+    Returns (number of constraints on v satisfied at best, best value for X_v), cached in the state.
+    """
+    
+    if state['moves'][v] is None:
+        gene = state['gene']
+        intervals = []
+        fixed = 0 # satisfied constraints of X_v with itself, whatever its value
+        for k in state['index'][v]:
+            c = T[k]
+            if c['i'] == c['j']:
+                fixed += state['satisfied'][k]
+                continue
+            for l, r in state['intervals'][k]: # merged, so each constraint counts at most once in the sweep
+                if c['i'] == v:
+                    intervals.append( (gene[c['j']] - r, gene[c['j']] - l) )
+                else:
+                    intervals.append( (gene[c['i']] + l, gene[c['i']] + r) )
+        
+        if intervals:
+            unsatisfied, value = sweep_line(intervals)
+            state['moves'][v] = (fixed + len(intervals) - unsatisfied, value)
+        else:
+            state['moves'][v] = (fixed, gene[v])
+    
+    return state['moves'][v]
+
+def move_gain(state, T, v):
+    """
+    Returns (reduction of the failed constraints when X_v moves to its best value, that value).
+    Both counts are in constraints, see best_move.
+    """
+    
+    top, value = best_move(state, T, v)
+    return top - (len(state['index'][v]) - state['failed_per_variable'][v]), value
+
+def walk_state_step(state, T, pick_best_gene=True):
+    """
+    Same as walk_gene, on a walk_state: moves one variable to the best place given its neighbours.
+    Only the variables next to the last change have their best move recomputed.
+    """
+    
+    index = state['index']
+    num_variables = len(index) - 1
+    
+    if pick_best_gene:
+        reduction = None
+        best_variable = -1
+        best_value = 0
+        for v in range(1, num_variables+1):
+            gain, value = move_gain(state, T, v)
+            if reduction is None or gain >= reduction: # >= so it doesnt get stuck, like walk_gene
+                reduction = gain
+                best_variable = v
+                best_value = value
+        assign(state, T, best_variable, best_value)
+    else:
+        v = randint(1, num_variables)
+        assign(state, T, v, best_move(state, T, v)[1])
+
 
 """
 ----------------------------------------------
@@ -107,8 +320,12 @@ Genetic Particularities
 def fitness(gene, T):
     return -len(verify_witness(gene, T))
 
-def select(genes, retainment_ratio, T):
-    genes.sort(key=lambda g: -fitness(g, T))
+def select(genes, retainment_ratio, T, compiled=None, failures=None):
+    # the whole pool is verified in one batch (unless its failures are given), compiled being T in compile_problem form
+    if failures is None:
+        failures = verify_batch(np.array(genes), compiled if compiled is not None else T)
+    order = np.argsort(failures, kind='stable')
+    genes = [genes[k] for k in order]
     return genes[: int(len(genes)*retainment_ratio+1)]
 
 def crossover(genes, gene_pool_size):
@@ -120,17 +337,79 @@ def crossover(genes, gene_pool_size):
         
     return genes
 
-def mutate(T, genes, mutation_chance, r):
+def mutate(T, genes, mutation_chance, r, compiled=None):
     for g in genes:
         if uniform(0, 1) < mutation_chance:
     # TODO:
     #        g[randint(0, len(g)-1)] = randint(-r, r)
     # or
-            walk_gene(g, T)
+            walk_gene(g, T, compiled=compiled)
             
     return genes
     
 
+def random_population(T, r, size, rng):
+    """ Returns a (size, n+1) matrix of random genes within [-r, r] and X_0 = 0, drawn from rng. """
+    
+    num_variables = max([max(t['i'], t['j']) for t in T])
+    P = rng.integers(-r, r, size=(size, num_variables+1), endpoint=True)
+    P[:, 0] = 0
+    return P
+
+def select_population(P, failures, keep, rng, selection='tournament', tournament_size=2):
+    """
+    Returns the 'keep' rows of population P that survive, the best one first (elitism).
+    With 'elitist' selection these are the best rows, with 'tournament' selection the best one
+    and the winners of keep-1 tournaments between tournament_size random rows.
+    """
+    
+    return P[select_indices(failures, keep, rng, selection, tournament_size)]
+
+def select_indices(failures, keep, rng, selection='tournament', tournament_size=2):
+    """
+    Returns the indices of the rows select_population keeps.
+    """
+    
+    best = int(np.argmin(failures))
+    if selection == 'elitist':
+        return np.argsort(failures, kind='stable')[:keep]
+    
+    entrants = rng.integers(0, len(failures), size=(keep-1, tournament_size))
+    winners = entrants[np.arange(keep-1), np.argmin(failures[entrants], axis=1)]
+    return np.r_[best, winners]
+
+def crossover_population(parents, size, rng, kind='one-point'):
+    """
+    Returns 'size' children of random pairs of parents, with 'one-point' or 'uniform' crossover.
+    """
+    
+    num_genes = parents.shape[1]
+    mothers = parents[rng.integers(0, len(parents), size=size)]
+    fathers = parents[rng.integers(0, len(parents), size=size)]
+    
+    if kind == 'uniform':
+        from_mother = rng.random((size, num_genes)) < 0.5
+    else:
+        cross_index = rng.integers(1, num_genes, size=size) if num_genes > 1 else np.ones(size, dtype=int)
+        from_mother = np.arange(num_genes)[None, :] < cross_index[:, None]
+    
+    return np.where(from_mother, mothers, fathers)
+
+def mutate_population(P, mutation_chance, r, rng, start=1):
+    """
+    Resets one random variable (not X_0) to a random value in [-r, r] in each row from 'start' on,
+    with probability mutation_chance. Modifies P in place.
+    """
+    
+    rows = start + np.flatnonzero(rng.random(len(P) - start) < mutation_chance)
+    if len(rows) == 0 or P.shape[1] < 2:
+        return P
+    
+    columns = rng.integers(1, P.shape[1], size=len(rows))
+    P[rows, columns] = rng.integers(-r, r, size=len(rows), endpoint=True)
+    return P
+    
+
 """
 ----------------------------------------------
           Main Algorithms Start Here.
@@ -138,7 +417,8 @@ def mutate(T, genes, mutation_chance, r):
 """
     
 
-def direct_random(T, r, iterations, verbose=False):
+def direct_random(T, r, iterations, verbose=False, timeout=None, deadline=None, cancel=None, stats=None,
+                  batch_size=256):
     """
     Direct random algorithm.
     
@@ -146,23 +426,44 @@ def direct_random(T, r, iterations, verbose=False):
     T -- the constraint problem
     r -- range [-r, r] of assignments to consider
     iterations -- number of maximum random iterations
+    batch_size -- number of random genes verified at once
+    timeout, deadline, cancel -- stop early once timeout seconds pass, the time.monotonic() deadline passes,
+                                 or cancel.is_set(), returning the best gene so far
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN') and number of 'iterations'
     """
     
+    deadline = make_deadline(timeout, deadline)
+    compiled = compile_problem(T)
     best_gene = None
-    best_gene_failed = None
-    
-    for i in range(iterations):
-        gene = random_gene(T, r)
-        gene_failed = verify_witness(gene, T)
-        if not best_gene or len(gene_failed) < len(best_gene_failed):
-            best_gene = gene
-            best_gene_failed = gene_failed
+    best_failures = None
+    
+    # genes are drawn and verified in batches
+    i = 0
+    while i < iterations:
+        genes = [random_gene(T, r) for _ in range(min(batch_size, iterations - i))]
+        failures = verify_batch(np.array(genes), compiled)
         
-        if len(gene_failed) == 0:
+        k = int(np.argmin(failures)) # first best, so the first solution if there is one
+        if best_gene is None or failures[k] < best_failures:
+            best_gene = genes[k]
+            best_failures = failures[k]
+        
+        if best_failures == 0:
+            i += k + 1
             break
-            
+        i += len(genes)
+        
+        if expired(deadline, cancel):
+            break
+    
+    best_gene_failed = verify_witness(best_gene, T)
+    
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = i
+    
     if verbose:
-        print(f'num iterations: {i+1}')
+        print(f'num iterations: {i}')
         print('best gene:', best_gene)
         print('constraints failed:', len(best_gene_failed), 'out of:', len(T)) 
         print('failed constraints:', best_gene_failed)
@@ -170,7 +471,8 @@ def direct_random(T, r, iterations, verbose=False):
     return best_gene, best_gene_failed
     
     
-def direct_walk(T, r, max_iterations, max_flips, pick_best_gene, verbose=False):
+def direct_walk(T, r, max_iterations, max_flips, pick_best_gene, verbose=False,
+                timeout=None, deadline=None, cancel=None, stats=None):
     """
     Direct walk-based algorithm.
     
@@ -180,28 +482,36 @@ def direct_walk(T, r, max_iterations, max_flips, pick_best_gene, verbose=False):
     max_iterations -- number of maximum random iterations
     max_flips -- maximum number of walks per iteration
     pick_best_gene -- whether to do extra work to find best gene to walk
+    timeout, deadline, cancel -- stop early, see direct_random
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN') and number of 'iterations'
     """
     
+    deadline = make_deadline(timeout, deadline)
+    index = incidence(T)
     best_gene = None
-    best_gene_failed = None
+    best_failures = None
     
     for i in range(max_iterations):
-        gene = random_gene(T, r)
+        state = walk_state(random_gene(T, r), T, index)
         
         for j in range(max_flips):
-            gene_failed = verify_witness(gene, T)
-            
-            if not best_gene or len(gene_failed) < len(best_gene_failed):
-                best_gene = gene
-                best_gene_failed = gene_failed
+            if best_gene is None or state['num_failed'] < best_failures:
+                best_gene = list(state['gene'])
+                best_failures = state['num_failed']
             
-            if len(gene_failed) == 0:
+            if state['num_failed'] == 0 or expired(deadline, cancel):
                 break
                 
-            gene = walk_gene(gene, T, pick_best_gene)
+            walk_state_step(state, T, pick_best_gene)
                 
         # necessary for double break after flips loop
-        if len(gene_failed) == 0: break
+        if state['num_failed'] == 0 or expired(deadline, cancel): break
+    
+    best_gene_failed = verify_witness(best_gene, T)
+    
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = i+1
     
     if verbose:
         print(f'num iterations: {i+1}')
@@ -212,12 +522,110 @@ def direct_walk(T, r, max_iterations, max_flips, pick_best_gene, verbose=False):
     return best_gene, best_gene_failed
     
         
+def luby(i):
+    """ Returns the i-th term (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ... """
+    
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if i == (1 << k) - 1:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+def direct_tabu(T, r, max_flips, noise=0.1, tabu_tenure=10, restart_unit=100, verbose=False,
+                timeout=None, deadline=None, cancel=None, stats=None):
+    """
+    Direct min-conflicts algorithm with a tabu list.
+    Each flip moves a variable of a failed constraint to its best place (see sweep_line): with probability 'noise'
+    a random one, otherwise the one which reduces the failures the most among those not moved in the last
+    'tabu_tenure' flips (unless it beats the best so far). Restarts from a random gene follow the Luby schedule.
+    
+    Arguments:
+    T -- the constraint problem
+    r -- range [-r, r] of assignments to consider
+    max_flips -- maximum number of flips over all restarts
+    noise -- probability of a random walk flip
+    tabu_tenure -- number of flips during which a moved variable is tabu
+    restart_unit -- flips per unit of the Luby restart schedule
+    timeout, deadline, cancel -- stop early, see direct_random
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN'), number of 'flips' and of 'restarts'
+    """
+    
+    deadline = make_deadline(timeout, deadline)
+    index = incidence(T)
+    num_variables = len(index) - 1
+    best_gene = None
+    best_failures = None
+    
+    flips = 0
+    restarts = 0
+    while flips < max_flips and not expired(deadline, cancel):
+        state = walk_state(random_gene(T, r), T, index)
+        moved = [-tabu_tenure - 1 for _ in index]
+        restart_flips = flips + restart_unit * luby(restarts + 1)
+        
+        while True:
+            if best_gene is None or state['num_failed'] < best_failures:
+                best_gene = list(state['gene'])
+                best_failures = state['num_failed']
+            
+            if best_failures == 0 or flips >= min(max_flips, restart_flips) or expired(deadline, cancel):
+                break
+            
+            conflicted = [v for v in range(1, num_variables+1) if state['failed_per_variable'][v]]
+            
+            if random() < noise:
+                v = choice(conflicted)
+            else:
+                v = None
+                reduction = None
+                for u in conflicted:
+                    gain, _ = move_gain(state, T, u)
+                    tabu = flips - moved[u] <= tabu_tenure
+                    if tabu and state['num_failed'] - gain >= best_failures:
+                        continue
+                    if reduction is None or gain > reduction:
+                        reduction = gain
+                        v = u
+                if v is None: # everything is tabu
+                    v = choice(conflicted)
+            
+            assign(state, T, v, best_move(state, T, v)[1])
+            moved[v] = flips
+            flips += 1
+        
+        if best_failures == 0: break
+        restarts += 1
+    
+    best_gene_failed = verify_witness(best_gene, T)
+    
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['flips'] = flips
+        stats['restarts'] = restarts
+    
+    if verbose:
+        print(f'num flips: {flips}, restarts: {restarts}')
+        print('best gene:', best_gene)
+        print('constraints failed:', len(best_gene_failed), 'out of:', len(T)) 
+        print('failed constraints:', best_gene_failed)
+    
+    return best_gene, best_gene_failed
+    
+        
 def direct_genetic(T, r,
             gene_pool_size,
             retainment_ratio,
             mutation_chance,
             max_iterations,
-            verbose=False):
+            verbose=False,
+            timeout=None,
+            deadline=None,
+            cancel=None,
+            stats=None,
+            stall_generations=None,
+            diversity_threshold=None,
+            restart_on_stagnation=False):
     
     """
     Direct genetic algorithm.
@@ -229,21 +637,127 @@ def direct_genetic(T, r,
     retainment_ratio -- probability of keeping a gene from one iteration to the other
     mutation_chance -- how likely a gene is to be walked
     max_iterations -- maximum number of iterations before failure
+    timeout, deadline, cancel -- stop early, see direct_random
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN'), number of 'iterations',
+             the reason it 'stopped' ('solved', 'iterations', 'timeout', 'stalled' or 'diversity'), the number of
+             'restarts', and the 'history' of the best and mean number of failed constraints of each generation
+    stall_generations -- stop once the best gene did not improve for this many generations (None to never)
+    diversity_threshold -- stop once the fraction of distinct genes falls below it (None to never)
+    restart_on_stagnation -- instead of stopping on stall or diversity, keep the best gene and draw the others anew
     """
     
+    deadline = make_deadline(timeout, deadline)
+    compiled = compile_problem(T)
     genes = [random_gene(T, r) for i in range(gene_pool_size)]
+    history = []
+    since = 0 # start of the history since the last restart
+    restarts = 0
     
-    for it in range(max_iterations):
-        genes = select(genes, retainment_ratio, T)
+    it = 0
+    while True:
+        failures = verify_batch(np.array(genes), compiled)
+        record_generation(history, failures)
+        
+        if failures.min() == 0:
+            stopped = 'solved'
+        elif it >= max_iterations:
+            stopped = 'iterations'
+        elif expired(deadline, cancel):
+            stopped = 'timeout'
+        else:
+            stopped = converged(history[since:], genes, stall_generations, diversity_threshold)
+            if stopped is not None and restart_on_stagnation:
+                genes = [genes[int(np.argmin(failures))]] + [random_gene(T, r) for i in range(gene_pool_size-1)]
+                failures = verify_batch(np.array(genes), compiled)
+                since = len(history)
+                restarts += 1
+                stopped = None
+        if stopped is not None: break
+        
+        genes = select(genes, retainment_ratio, T, compiled, failures)
         genes = crossover(genes, gene_pool_size)
-        genes = mutate(T, genes, mutation_chance, r)
+        genes = mutate(T, genes, mutation_chance, r, compiled)
+        it += 1
+    
+    best_gene = genes[int(np.argmin(failures))] # first best
+    best_gene_failed = verify_witness(best_gene, T)
+    
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = it
+        stats['stopped'] = stopped
+        stats['restarts'] = restarts
+        stats['history'] = history
+    
+    if verbose:
+        print('best gene:', best_gene)
+        print('constraints failed:', len(best_gene_failed), 'out of:', len(T)) 
+        print('failed constraints:', best_gene_failed)
+
+    return best_gene, best_gene_failed
+
+
+def direct_genetic_np(T, r,
+            gene_pool_size,
+            retainment_ratio,
+            mutation_chance,
+            max_iterations,
+            selection='tournament',
+            tournament_size=2,
+            crossover='one-point',
+            seed=None,
+            verbose=False,
+            timeout=None,
+            deadline=None,
+            cancel=None,
+            stats=None):
+    
+    """
+    Direct genetic algorithm on a (gene_pool_size, n+1) matrix population, for large pools.
+    Each generation is verified in one verify_batch call; selection, crossover and mutation are vectorized.
+    Mutation resets a random variable instead of walking it.
     
-    best_gene = select(genes, 1, T)[0] # to sort genes such that first is best
+    Arguments:
+    T -- the constraint problem
+    r -- range [-r, r] of assignments to consider
+    gene_pool_size -- number of genes kept in the pool
+    retainment_ratio -- fraction of genes surviving from one iteration to the other
+    mutation_chance -- how likely a gene is to be mutated
+    max_iterations -- maximum number of iterations before failure
+    selection -- 'tournament' or 'elitist', see select_population
+    tournament_size -- number of genes per tournament
+    crossover -- 'one-point' or 'uniform'
+    seed -- seed (or numpy.random.Generator) for reproducible runs
+    timeout, deadline, cancel -- stop early, see direct_random
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN') and number of 'iterations'
+    """
+    
+    deadline = make_deadline(timeout, deadline)
+    rng = np.random.default_rng(seed)
+    compiled = compile_problem(T)
+    keep = min(gene_pool_size, int(gene_pool_size*retainment_ratio+1))
+    
+    P = random_population(T, r, gene_pool_size, rng)
+    failures = verify_batch(P, compiled)
+    
+    it = 0
+    while it < max_iterations and failures.min() > 0 and not expired(deadline, cancel):
+        parents = select_population(P, failures, keep, rng, selection, tournament_size)
+        children = crossover_population(parents, gene_pool_size - keep, rng, crossover)
+        P = mutate_population(np.vstack([parents, children]), mutation_chance, r, rng)
+        failures = verify_batch(P, compiled)
+        it += 1
+    
+    best_gene = P[int(np.argmin(failures))].tolist()
     best_gene_failed = verify_witness(best_gene, T)
     
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = it
+    
     if verbose:
         print('best gene:', best_gene)
         print('constraints failed:', len(best_gene_failed), 'out of:', len(T)) 
         print('failed constraints:', best_gene_failed)
 
-    return best_gene, best_gene_failed
\ No newline at end of file
+    return best_gene, best_gene_failed
@@ -1,38 +1,71 @@
+from collections import OrderedDict
 from random import choice, randint, uniform
 
+import numpy as np
+
 from problem_generator import generate_problem
-from verifier import verify_witness
+from verifier import compile_problem, verify_batch, verify_witness
+from deadlines import SAT, UNKNOWN, expired, make_deadline
+from convergence import converged, record_generation
 
 from exact_solver import consistent
 from exact_solver import discrete_graph
-from exact_solver import generate_d_graph
+from exact_solver import generate_d_graph, generate_d_graphs_np
 from exact_solver import get_min_sol, get_middles_sol
-from exact_solver import solve_stp
 
-def random_gene(T):
+def random_gene(T, cache=None):
     """
     Returns a random gene, ie. selection of intervals for the constraints.
-    The gene is of the form [interval selection, distance graph, failed constraints]
+    The gene is of the form [interval selection, distance graph, failed constraints, d-graph]
+    where the d-graph is the closed distance graph, or None if it has to be recomputed.
+    (cache -- optional fitness_cache consulted before closing and verifying)
     """
     
     num_variables = max([max(t['i'], t['j']) for t in T])
     interval_selection = [randint(0, len(constr['intervals'])-1) for constr in T]
-    gene = [interval_selection, discrete_graph(num_variables+1), None]
+    gene = [interval_selection, discrete_graph(num_variables+1), None, None]
     update_graph(gene, T)
-    d_graph = generate_d_graph(gene[1]) # costly op.
-    failed = verify_witness(get_middles_sol(d_graph), T)
-    gene[2] = failed
+    evaluate_gene(gene, T, cache)
     
     return gene
 
+def evaluate_gene(gene, T, cache=None, witness='middles'):
+    """
+    Sets the failed constraints of a gene, for its 'middles' (get_middles_sol) or 'min' (get_min_sol) solution,
+    and its d-graph if unset. The cache is consulted first, and filled otherwise. Returns the d-graph.
+    """
+    
+    entry = cache_lookup(cache, gene[0], witness) if cache is not None else None
+    if entry is not None:
+        if gene[3] is None:
+            gene[3] = entry['d_graph'].tolist()
+        gene[2] = entry['failed'][witness]
+        return gene[3]
+    
+    d_graph = gene[3] if gene[3] is not None else close_gene(gene) # costly op.
+    sol = get_middles_sol(d_graph) if witness == 'middles' else get_min_sol(d_graph)
+    gene[2] = verify_witness(sol, T)
+    if cache is not None:
+        cache_store(cache, gene[0], d_graph, gene[2], witness)
+    return d_graph
+
 def gene_to_witness(gene, T):
     """
     Given a gene, returns a particular solution.
     """
     
-    update_graph(gene, T)
-    d_graph = generate_d_graph(gene[1])
-    return get_middles_sol(d_graph)
+    if gene[3] is None:
+        update_graph(gene, T)
+        close_gene(gene)
+    return get_middles_sol(gene[3])
+
+def close_gene(gene):
+    """
+    Recomputes a gene's d-graph from its distance graph, in O(n^3), and returns it.
+    """
+    
+    gene[3] = generate_d_graph(gene[1])
+    return gene[3]
 
 def update_graph(gene, T):
     """
@@ -43,6 +76,7 @@ def update_graph(gene, T):
     interval_selection = gene[0]
     graph = gene[1]
     gene[2] = None # unset
+    gene[3] = None
     
     for i, constr in enumerate(T):
         interval_index = interval_selection[i]
@@ -55,12 +89,14 @@ def update_graph(gene, T):
 
 def update_graph_at_constraint(gene, constraint_index, T):
     """
-    Update a gene's distance graph to apply the interval selection at gene[constraint_index]
+    Update a gene's distance graph to apply the interval selection at gene[constraint_index],
+    and unset its d-graph.
     """
     
     interval_selection = gene[0]
     graph = gene[1]
     gene[2] = None # unset
+    gene[3] = None
     
     interval_index = interval_selection[constraint_index]
     constr = T[constraint_index]
@@ -94,20 +130,88 @@ def walk_gene(gene, T):
     
     
     
+def fitness_cache(capacity=1024):
+    """
+    Returns an empty bounded cache from interval selections to their d-graph and failed constraints,
+    with least recently used eviction. It counts its 'hits' and 'misses'.
+    """
+    
+    return {'capacity': capacity, 'entries': OrderedDict(), 'hits': 0, 'misses': 0}
+
+def cache_lookup(cache, selection, witness='middles'):
+    """
+    Returns the entry {'d_graph': array, 'failed': {witness: failed constraints}} of a selection
+    if it has failed constraints for the witness, or None.
+    """
+    
+    key = tuple(selection)
+    entry = cache['entries'].get(key)
+    if entry is None or witness not in entry['failed']:
+        cache['misses'] += 1
+        return None
+    
+    cache['entries'].move_to_end(key)
+    cache['hits'] += 1
+    return entry
+
+def cache_store(cache, selection, d_graph, failed, witness='middles'):
+    """
+    Stores (a copy of) the d-graph and the failed constraints of a selection, evicting the least recently used.
+    """
+    
+    key = tuple(selection)
+    entry = cache['entries'].get(key)
+    if entry is None:
+        entry = {'d_graph': np.array(d_graph), 'failed': {}}
+        cache['entries'][key] = entry
+        if len(cache['entries']) > cache['capacity']:
+            cache['entries'].popitem(last=False)
+    else:
+        cache['entries'].move_to_end(key)
+    entry['failed'][witness] = failed
+    
+    
 """
 ----------------------------------------------
           Genetic particularities.
 ----------------------------------------------
 """
     
-def evaluate(genes, T):
+def evaluate(genes, T, compiled=None, cache=None):
     """
-    For each gene, compute the failed constraints.
+    For each gene changed since it was last evaluated (whose failed constraints are unset), compute them.
+    (compiled -- optionally T in verifier.compile_problem form)
+    (cache -- optional fitness_cache consulted first, and filled with the rest)
     """
     
+    missed = []
     for g in genes:
-        d_graph = generate_d_graph(g[1]) # costly op.
-        g[2] = verify_witness(get_middles_sol(d_graph), T)
+        if g[2] is not None: continue # untouched
+        
+        entry = cache_lookup(cache, g[0]) if cache is not None else None
+        if entry is None:
+            missed.append(g)
+            continue
+        if g[3] is None:
+            g[3] = entry['d_graph'].tolist()
+        g[2] = entry['failed']['middles']
+    
+    if not missed: return genes
+    
+    # costly op., done at once for the genes whose d-graph could not be kept up to date
+    stale = [g for g in missed if g[3] is None]
+    if stale:
+        for g, d_graph in zip(stale, generate_d_graphs_np([g[1] for g in stale])):
+            g[3] = d_graph.tolist()
+    
+    d_graphs = np.array([g[3] for g in missed])
+    # middles solutions of the pool, verified in one batch
+    witnesses = (d_graphs[:, 0, :] - d_graphs[:, :, 0]) / 2
+    _, failed = verify_batch(witnesses, compiled if compiled is not None else T, masks=True)
+    for g, d_graph, mask in zip(missed, d_graphs, failed):
+        g[2] = [T[k] for k in np.flatnonzero(mask)]
+        if cache is not None:
+            cache_store(cache, g[0], d_graph, g[2])
     return genes
 
 def fitness(gene, T):
@@ -129,19 +233,30 @@ def select(genes, retainment_ratio, T):
 def crossover(genes, gene_pool_size, T):
     """
     Cross over the genes individually, creating new genes, until gene_pool_size is full.
+    Each child starts from a copy of the graphs of the parent it differs least from,
+    and only applies the other parent's differing interval selections.
     """
     
-    num_variables = max([max(t['i'], t['j']) for t in T])
+    num_parents = len(genes)
     while len(genes) < gene_pool_size:
-        i = randint(0, len(genes)-1)
-        j = randint(0, len(genes)-1)
-        cross_index = randint(1, len(genes[0])-1)
+        i = randint(0, num_parents-1)
+        j = randint(0, num_parents-1)
+        selection_i, selection_j = genes[i][0], genes[j][0]
+        cross_index = randint(1, len(selection_i)-1) if len(selection_i) > 1 else 1
+        
+        selection = selection_i[:cross_index] + selection_j[cross_index:]
+        from_i = [k for k in range(cross_index, len(selection)) if selection_i[k] != selection_j[k]]
+        from_j = [k for k in range(cross_index) if selection_i[k] != selection_j[k]]
+        parent, differing = (genes[i], from_i) if len(from_i) <= len(from_j) else (genes[j], from_j)
         
         g = [
-            genes[i][0][:cross_index] + genes[j][0][cross_index:],
-            discrete_graph(num_variables+1),
-            None
+            selection,
+            [row[:] for row in parent[1]],
+            parent[2],
+            [row[:] for row in parent[3]] if parent[3] is not None and not differing else None
         ]
+        for k in differing:
+            update_graph_at_constraint(g, k, T)
         
         genes.append(g)
         
@@ -165,15 +280,19 @@ def mutate(T, genes, mutation_chance):
 """
     
     
-def meta_random(T, iterations=50, verbose=False):
+def meta_random(T, iterations=50, verbose=False, timeout=None, deadline=None, cancel=None, stats=None):
     """
     Meta random algorithm.
     
     Arguments:
     T -- the constraints
     iterations -- max number of iterations
+    timeout, deadline, cancel -- stop early once timeout seconds pass, the time.monotonic() deadline passes,
+                                 or cancel.is_set(), returning the best gene so far
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN') and number of 'iterations'
     """
     
+    deadline = make_deadline(timeout, deadline)
     best_gene = None
     best_gene_failed = None
     
@@ -185,9 +304,13 @@ def meta_random(T, iterations=50, verbose=False):
             best_gene = gene
             best_gene_failed = gene_failed
         
-        if len(gene_failed) == 0:
+        if len(gene_failed) == 0 or expired(deadline, cancel):
             break
            
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = i+1
+    
     if verbose:
         print(f'num iterations: {i+1}')
         print('best gene:', best_gene)
@@ -197,7 +320,8 @@ def meta_random(T, iterations=50, verbose=False):
     return best_gene[0], best_gene_failed, gene_to_witness(best_gene, T)
     
     
-def meta_walk(T, max_iterations, max_flips, verbose=False):
+def meta_walk(T, max_iterations, max_flips, verbose=False, timeout=None, deadline=None, cancel=None, stats=None,
+              cache_size=1024):
     """
     Meta walk algorithm.
     
@@ -205,33 +329,45 @@ def meta_walk(T, max_iterations, max_flips, verbose=False):
     T -- the constraints
     max_iterations -- max number of iterations
     max_flips -- max number of flips
+    timeout, deadline, cancel -- stop early, see meta_random
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN'), number of 'iterations'
+             and fitness cache 'cache_hits' and 'cache_misses'
+    cache_size -- number of interval selections kept in the fitness cache (0 disables it)
     """
-        
-    num_variables = max([max(t['i'], t['j']) for t in T])
-    graph = discrete_graph(num_variables+1)
     
+    deadline = make_deadline(timeout, deadline)
+    cache = fitness_cache(cache_size) if cache_size else None
+        
     best_gene = None
     best_gene_failed = None
     
     for i in range(max_iterations):
-        gene = random_gene(T)
-        update_graph(gene, T)
+        gene = random_gene(T, cache)
         
         for j in range(max_flips):
             # at each iteration we modify
-
-            is_consistent, witness = solve_stp(gene[1])
-            gene_failed = verify_witness(witness, T)
-            gene[2] = gene_failed
+            
+            d_graph = evaluate_gene(gene, T, cache, witness='min')
+            is_consistent = consistent(d_graph)
+            gene_failed = gene[2]
             
             if not best_gene or len(gene_failed) < len(best_gene_failed):
-                best_gene = gene
+                best_gene = [list(gene[0]), None, gene_failed, None] # gene keeps walking
                 best_gene_failed = gene_failed
 
-            if is_consistent:
+            if is_consistent or expired(deadline, cancel):
                 break
                 
             walk_gene(gene, T)
+        
+        if expired(deadline, cancel): break
+    
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = i+1
+        if cache is not None:
+            stats['cache_hits'] = cache['hits']
+            stats['cache_misses'] = cache['misses']
     
     if verbose:
         print(f'num flips: {i+1}, num iterations: {j+1}')
@@ -246,7 +382,15 @@ def meta_genetic(T,
             retainment_ratio,
             mutation_chance,
             max_iterations,
-            verbose=False):
+            verbose=False,
+            timeout=None,
+            deadline=None,
+            cancel=None,
+            stats=None,
+            cache_size=1024,
+            stall_generations=None,
+            diversity_threshold=None,
+            restart_on_stagnation=False):
     
     """
     Meta genetic algorithm.
@@ -257,20 +401,64 @@ def meta_genetic(T,
     retainment_ratio -- ratio of genes to keep from one iteration into the next
     mutation_chance -- chance of walking a gene at iteration step
     max_iterations -- max number of iterations to run
+    timeout, deadline, cancel -- stop early, see meta_random
+    stats -- optional dict, filled with the 'status' ('SAT' or 'UNKNOWN'), number of 'iterations',
+             fitness cache 'cache_hits' and 'cache_misses',
+             the reason it 'stopped' ('solved', 'iterations', 'timeout', 'stalled' or 'diversity'), the number of
+             'restarts', and the 'history' of the best and mean number of failed constraints of each generation
+    cache_size -- number of interval selections kept in the fitness cache (0 disables it)
+    stall_generations -- stop once the best gene did not improve for this many generations (None to never)
+    diversity_threshold -- stop once the fraction of distinct genes falls below it (None to never)
+    restart_on_stagnation -- instead of stopping on stall or diversity, keep the best gene and draw the others anew
     """
     
-    genes = [random_gene(T) for i in range(gene_pool_size)]
-    
-    for it in range(max_iterations):
-        genes = evaluate(genes, T)
+    deadline = make_deadline(timeout, deadline)
+    compiled = compile_problem(T)
+    cache = fitness_cache(cache_size) if cache_size else None
+    genes = [random_gene(T, cache) for i in range(gene_pool_size)]
+    history = []
+    since = 0 # start of the history since the last restart
+    restarts = 0
+    
+    it = 0
+    while True:
+        genes = evaluate(genes, T, compiled, cache)
+        failures = [len(g[2]) for g in genes]
+        record_generation(history, failures)
+        
+        if min(failures) == 0:
+            stopped = 'solved'
+        elif it >= max_iterations:
+            stopped = 'iterations'
+        elif expired(deadline, cancel):
+            stopped = 'timeout'
+        else:
+            stopped = converged(history[since:], [g[0] for g in genes], stall_generations, diversity_threshold)
+            if stopped is not None and restart_on_stagnation:
+                genes = select(genes, 0, T) + [random_gene(T, cache) for i in range(gene_pool_size-1)] # keeps the best gene
+                since = len(history)
+                restarts += 1
+                stopped = None
+        if stopped is not None: break
+        
         genes = select(genes, retainment_ratio, T)
         genes = crossover(genes, gene_pool_size, T)
         genes = mutate(T, genes, mutation_chance)
+        it += 1
     
-    genes = evaluate(genes, T)
     best_gene = select(genes, 1, T)[0] # to sort genes such that first is best
     best_gene_failed = best_gene[2]
     
+    if stats is not None:
+        stats['status'] = SAT if not best_gene_failed else UNKNOWN
+        stats['iterations'] = it
+        stats['stopped'] = stopped
+        stats['restarts'] = restarts
+        stats['history'] = history
+        if cache is not None:
+            stats['cache_hits'] = cache['hits']
+            stats['cache_misses'] = cache['misses']
+    
     if verbose:
         print('best gene:', best_gene[0])
         print('constraints failed:', len(best_gene_failed), 'out of:', len(T)) 
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+from array import array
+from bisect import bisect_right
+
+class IntervalSet:
+    """
+    Immutable ordered disjoint list of closed intervals, backed by flat arrays of endpoints.
+    It behaves like the list of (a, b) tuples used elsewhere (len, indexing, iteration, ==),
+    so it can stand in for a constraint's 'intervals' anywhere.
+    
+    Overlapping or touching intervals are merged. With a positive 'gap', intervals less than gap apart are
+    merged too: gap=1 is what preprocessing uses, as it assumes integer solutions (see cleanup_intervals).
+    """
+    
+    __slots__ = ('lows', 'highs', '_hash')
+
+    def __init__(self, intervals=(), gap=0):
+        lows, highs = [], []
+        for begin, end in sorted(intervals):
+            if lows and highs[-1] >= begin - gap:
+                highs[-1] = max(highs[-1], end)
+            else:
+                lows.append(begin)
+                highs.append(end)
+        self._set(lows, highs)
+
+    @classmethod
+    def from_merged(cls, lows, highs):
+        """
+        Builds an IntervalSet from endpoint lists that are already ordered, disjoint and merged.
+        """
+        
+        ret = cls.__new__(cls)
+        ret._set(lows, highs)
+        return ret
+
+    def _set(self, lows, highs):
+        try:
+            self.lows = array('l', lows)
+            self.highs = array('l', highs)
+        except (TypeError, OverflowError): # some endpoint is not a (machine) integer
+            self.lows = array('d', lows)
+            self.highs = array('d', highs)
+        self._hash = None
+
+    def __len__(self):
+        return len(self.lows)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [(a, b) for a, b in zip(self.lows[k], self.highs[k])]
+        return (self.lows[k], self.highs[k])
+
+    def __iter__(self):
+        return zip(self.lows, self.highs)
+
+    def __reversed__(self):
+        return zip(reversed(self.lows), reversed(self.highs))
+
+    def __eq__(self, other):
+        if isinstance(other, IntervalSet):
+            if self._hash is not None and other._hash is not None and self._hash != other._hash:
+                return False
+            return self.lows == other.lows and self.highs == other.highs
+        try:
+            return len(self) == len(other) and all(tuple(x) == y for x, y in zip(other, self))
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((tuple(self.lows), tuple(self.highs))) # by value, like __eq__ across typecodes
+        return self._hash
+
+    def __repr__(self):
+        return f'IntervalSet({self.to_list()})'
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def to_list(self):
+        """
+        Returns the intervals as a list of (a, b) tuples.
+        """
+        
+        return list(zip(self.lows.tolist(), self.highs.tolist()))
+
+    def contains(self, x):
+        """
+        Returns whether x lies in one of the intervals, in O(log n).
+        """
+        
+        k = bisect_right(self.lows, x) - 1
+        return k >= 0 and x <= self.highs[k]
+
+    def reverse(self):
+        """
+        Returns the intervals of X_i - X_j given that these are the intervals of X_j - X_i.
+        """
+        
+        return IntervalSet.from_merged(
+            [-b for b in reversed(self.highs)],
+            [-a for a in reversed(self.lows)],
+        )
+
+    def intersect(self, other, gap=0):
+        """
+        Returns the intersection with another IntervalSet, with a two-pointer sweep in O(|I| + |J|).
+        (gap -- as in the constructor)
+        """
+        
+        lows, highs = [], []
+        A, B = self.lows.tolist(), self.highs.tolist()
+        C, D = other.lows.tolist(), other.highs.tolist()
+        i, j = 0, 0
+        while i < len(A) and j < len(C):
+            a, b, c, d = A[i], B[i], C[j], D[j]
+            low = a if a > c else c
+            high = b if b < d else d
+            if low <= high:
+                if lows and highs[-1] >= low - gap:
+                    if high > highs[-1]:
+                        highs[-1] = high
+                else:
+                    lows.append(low)
+                    highs.append(high)
+            
+            if b < d:
+                i += 1
+            else:
+                j += 1
+        
+        return IntervalSet.from_merged(lows, highs)
+
+    def compose(self, other, gap=0):
+        """
+        Returns the composition with another IntervalSet: all sums of a value in each.
+        The |I|*|J| sums are collected and sorted at C level, then merged linearly.
+        (gap -- as in the constructor)
+        """
+        
+        J = list(zip(other.lows.tolist(), other.highs.tolist()))
+        sums = [(a + c, b + d) for a, b in zip(self.lows.tolist(), self.highs.tolist()) for c, d in J]
+        sums.sort()
+        
+        lows, highs = [], []
+        for low, high in sums:
+            if lows and highs[-1] >= low - gap:
+                if high > highs[-1]:
+                    highs[-1] = high
+            else:
+                lows.append(low)
+                highs.append(high)
+        
+        return IntervalSet.from_merged(lows, highs)
+    
+    def cap(self, budget):
+        """
+        Returns (capped, merges): an over-approximation with at most 'budget' intervals,
+        obtained by filling the smallest gaps between consecutive intervals, and the number of gaps filled.
+        """
+        
+        merges = len(self) - budget
+        if merges <= 0:
+            return self, 0
+        
+        gaps = sorted(range(len(self) - 1), key=lambda k: (self.lows[k+1] - self.highs[k], k))
+        filled = set(gaps[:merges])
+        
+        lows, highs = [self.lows[0]], []
+        for k in range(len(self) - 1):
+            if k not in filled:
+                highs.append(self.highs[k])
+                lows.append(self.lows[k+1])
+        highs.append(self.highs[-1])
+        
+        return IntervalSet.from_merged(lows, highs), merges
+
+def interval_set(I, gap=0):
+    """
+    Returns I as an IntervalSet (I itself if it already is one).
+    (gap -- as in the IntervalSet constructor, for lists)
+    """
+    
+    return I if isinstance(I, IntervalSet) else IntervalSet(I, gap)
@@ -0,0 +1,252 @@
+#!/usr/bin/python3
+import multiprocessing as mp
+import os
+import random
+from queue import Empty
+
+import numpy as np
+
+from deadlines import SAT, UNKNOWN, expired, make_deadline
+from verifier import compile_problem, verify_batch, verify_witness
+
+def islands_solve(T, kind='direct', islands=None,
+            gene_pool_size=100,
+            retainment_ratio=0.3,
+            mutation_chance=0.5,
+            max_iterations=100,
+            migration_interval=10,
+            migration_size=2,
+            topology='ring',
+            r=100,
+            seed=None,
+            timeout=None,
+            deadline=None,
+            stats={},
+            verbose=False):
+    
+    """
+    Island model genetic algorithm: runs one population per worker process, and every migration_interval
+    generations each island sends copies of its migration_size best genes to another one, where they replace
+    the worst survivors. All islands stop as soon as one of them finds a gene with no failed constraints.
+    Returns (best_gene, best_gene_failed) like genetic_direct.direct_genetic_np for kind 'direct',
+    or (best interval selection, failed constraints) like genetic_meta.meta_genetic for kind 'meta'.
+    Fills in the "stats" dict with the 'status' ('SAT' or 'UNKNOWN') and per island stats under 'islands'
+    (islands whose process died are left out, RuntimeError is raised if all of them died).
+    
+    Arguments:
+    T -- the constraint problem
+    kind -- 'direct' (assignments, see genetic_direct) or 'meta' (interval selections, see genetic_meta)
+    islands -- number of islands, each in its own process (defaults to the number of cores)
+    gene_pool_size, retainment_ratio, mutation_chance, max_iterations -- per island, see the genetic algorithms
+    migration_interval -- number of generations between migrations
+    migration_size -- number of genes sent per migration
+    topology -- 'ring' (island k sends to island k+1) or 'random' (to a random other island each time)
+    r -- range [-r, r] of assignments to consider, for kind 'direct'
+    seed -- seed for reproducible islands (island k uses seed and k)
+    timeout, deadline -- stop early, see genetic_direct.direct_random
+    """
+    
+    if islands is None:
+        islands = os.cpu_count() or 1
+    deadline = make_deadline(timeout, deadline)
+    settings = {
+        'gene_pool_size': gene_pool_size,
+        'retainment_ratio': retainment_ratio,
+        'mutation_chance': mutation_chance,
+        'max_iterations': max_iterations,
+        'migration_interval': migration_interval,
+        'migration_size': migration_size,
+        'topology': topology,
+        'r': r,
+        'seed': seed,
+    }
+    
+    inboxes = [mp.Queue() for _ in range(islands)]
+    results = mp.Queue()
+    stop = mp.Event()
+    
+    target = direct_island if kind == 'direct' else meta_island
+    processes = [
+        mp.Process(target=target, args=(T, k, inboxes, results, stop, settings, deadline))
+        for k in range(islands)
+    ]
+    for p in processes:
+        p.start()
+    
+    found = []
+    try:
+        while len(found) < len(processes):
+            try:
+                found.append(results.get(timeout=0.1))
+            except Empty:
+                if not any(p.is_alive() for p in processes) and results.empty():
+                    break # some islands died without a result
+    finally:
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        for p in processes:
+            p.join()
+    
+    if not found:
+        raise RuntimeError('every island exited without a result')
+    
+    found.sort(key=lambda f: (f[2], f[0])) # fewest failures, then lowest island
+    best_gene = found[0][1]
+    
+    if kind == 'direct':
+        best_gene_failed = verify_witness(best_gene, T)
+    else:
+        from genetic_meta import evaluate_gene, update_graph
+        from exact_solver import discrete_graph
+        
+        num_variables = max([max(t['i'], t['j']) for t in T])
+        gene = [best_gene, discrete_graph(num_variables+1), None, None]
+        update_graph(gene, T)
+        evaluate_gene(gene, T)
+        best_gene_failed = gene[2]
+    
+    stats['status'] = SAT if not best_gene_failed else UNKNOWN
+    stats['islands'] = [f[3] for f in sorted(found, key=lambda f: f[0])]
+    
+    if verbose:
+        for k, island_stats in enumerate(stats['islands']):
+            print(f'island {k}:', island_stats)
+        print('best gene:', best_gene)
+        print('constraints failed:', len(best_gene_failed), 'out of:', len(T))
+    
+    return best_gene, best_gene_failed
+
+def migrate(migrants, index, inboxes, topology, rng, stats):
+    """
+    Sends the migrants (an array with a gene per row) to the next island, and returns
+    the genes received since the last migration as one array, or None if there are none.
+    """
+    
+    islands = len(inboxes)
+    if islands > 1 and len(migrants):
+        if topology == 'ring':
+            target = (index + 1) % islands
+        else:
+            target = int(rng.integers(0, islands - 1))
+            target += target >= index # any island but this one
+        inboxes[target].put(migrants)
+        stats['sent'] += len(migrants)
+    
+    received = []
+    while True:
+        try:
+            received.append(inboxes[index].get_nowait())
+        except Empty:
+            break
+    
+    if not received:
+        return None
+    received = np.vstack(received)
+    stats['received'] += len(received)
+    return received
+
+def seed_island(settings, index):
+    """
+    Seeds the random module of an island process, and returns its numpy.random.Generator.
+    (Forked processes would otherwise all share the parent's random state.)
+    """
+    
+    seed = settings['seed']
+    random.seed(None if seed is None else f'{seed}-{index}')
+    return np.random.default_rng(None if seed is None else [seed, index])
+
+def direct_island(T, index, inboxes, results, stop, settings, deadline):
+    """
+    Island process running genetic_direct.direct_genetic_np generations.
+    Sends (island index, best gene, number of failed constraints, stats) before it exits.
+    """
+    
+    from genetic_direct import crossover_population, mutate_population, random_population, select_indices
+    
+    for inbox in inboxes:
+        inbox.cancel_join_thread() # do not block on exit over migrants nobody will take
+    rng = seed_island(settings, index)
+    stats = {'iterations': 0, 'sent': 0, 'received': 0}
+    
+    size = settings['gene_pool_size']
+    keep = min(size, int(size*settings['retainment_ratio']+1))
+    compiled = compile_problem(T)
+    
+    P = random_population(T, settings['r'], size, rng)
+    failures = verify_batch(P, compiled)
+    
+    it = 0
+    while it < settings['max_iterations'] and failures.min() > 0 and not expired(deadline, stop):
+        survivors = select_indices(failures, keep, rng)
+        parents = P[survivors]
+        
+        if (it + 1) % settings['migration_interval'] == 0:
+            best = np.argsort(failures, kind='stable')[:settings['migration_size']]
+            received = migrate(P[best], index, inboxes, settings['topology'], rng, stats)
+            if received is not None and keep > 1:
+                received = received[:keep-1] # the best survivor stays
+                worst = np.argsort(failures[survivors], kind='stable')[-len(received):]
+                parents[worst] = received
+        
+        children = crossover_population(parents, size - keep, rng)
+        P = mutate_population(np.vstack([parents, children]), settings['mutation_chance'], settings['r'], rng)
+        failures = verify_batch(P, compiled)
+        it += 1
+    
+    if failures.min() == 0:
+        stop.set()
+    
+    best = int(np.argmin(failures))
+    stats['iterations'] = it
+    stats['best'] = int(failures[best])
+    results.put( (index, P[best].tolist(), int(failures[best]), stats) )
+
+def meta_island(T, index, inboxes, results, stop, settings, deadline):
+    """
+    Island process running genetic_meta.meta_genetic generations, migrating interval selections.
+    Sends (island index, best interval selection, number of failed constraints, stats) before it exits.
+    """
+    
+    from genetic_meta import crossover, evaluate, fitness_cache, mutate, random_gene, select, update_graph
+    from exact_solver import discrete_graph
+    
+    for inbox in inboxes:
+        inbox.cancel_join_thread() # do not block on exit over migrants nobody will take
+    rng = seed_island(settings, index)
+    stats = {'iterations': 0, 'sent': 0, 'received': 0}
+    
+    num_variables = max([max(t['i'], t['j']) for t in T])
+    size = settings['gene_pool_size']
+    compiled = compile_problem(T)
+    cache = fitness_cache()
+    
+    genes = [random_gene(T, cache) for _ in range(size)]
+    genes = select(evaluate(genes, T, compiled, cache), 1, T) # to sort genes such that first is best
+    
+    it = 0
+    while it < settings['max_iterations'] and genes[0][2] and not expired(deadline, stop):
+        genes = select(genes, settings['retainment_ratio'], T)
+        
+        if (it + 1) % settings['migration_interval'] == 0:
+            migrants = np.array([g[0] for g in genes[:settings['migration_size']]], dtype=np.int32)
+            received = migrate(migrants, index, inboxes, settings['topology'], rng, stats)
+            if received is not None:
+                for k, selection in enumerate(received[:len(genes)-1]): # the best survivor stays
+                    g = [selection.tolist(), discrete_graph(num_variables+1), None, None]
+                    update_graph(g, T)
+                    genes[len(genes)-1-k] = g
+        
+        genes = crossover(genes, size, T)
+        genes = mutate(T, genes, settings['mutation_chance'])
+        genes = select(evaluate(genes, T, compiled, cache), 1, T)
+        it += 1
+    
+    if not genes[0][2]:
+        stop.set()
+    
+    stats['iterations'] = it
+    stats['best'] = len(genes[0][2])
+    stats['cache_hits'] = cache['hits']
+    stats['cache_misses'] = cache['misses']
+    results.put( (index, list(genes[0][0]), len(genes[0][2]), stats) )
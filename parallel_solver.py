@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+import multiprocessing as mp
+import os
+from itertools import product
+from queue import Empty
+
+from deadlines import SAT, UNSAT, UNKNOWN, expired, make_deadline
+from exact_solver import add_constraint, discrete_graph, get_min_sol, undo
+
+def parallel_solve(constraints, workers=None, split_depth=2, stats={}, verbose=False,
+                   timeout=None, deadline=None, cancel=None):
+    """
+    Solve the general TCSP given by 'constraints' with a parallel backtracking search.
+    The interval choices of the first split_depth constraints are split into subproblems,
+    which worker processes take from a shared queue. A worker notices when others are idle
+    and donates the untried intervals at its shallowest open level as new subproblems.
+    Returns a valid assignment X or None.
+    Fills in the "stats" dict, summed over all workers, stats['status'] being 'SAT', 'UNSAT'
+    (only once every subproblem is exhausted) or 'UNKNOWN' if the search was stopped early
+    or a worker died.
+    
+    Arguments:
+    constraints -- the constraint problem
+    workers -- number of worker processes (defaults to the number of cores)
+    split_depth -- number of leading constraints with several intervals whose selections make up the initial subproblems
+    timeout, deadline -- stop searching after timeout seconds or at the time.monotonic() deadline, see exact_solver.solve
+    cancel -- cancellation token shared with the workers (eg. multiprocessing.Event), the search stops once it is set
+    """
+    
+    from copy import deepcopy
+    c2 = deepcopy(constraints)
+    c2.sort(key=lambda l: len(l['intervals']))
+    
+    if workers is None:
+        workers = os.cpu_count() or 1
+    deadline = make_deadline(timeout, deadline)
+    # split on the first split_depth constraints that actually have a choice of intervals
+    depth, branching = 0, 0
+    while depth < len(c2) and branching < split_depth:
+        if len(c2[depth]['intervals']) > 1:
+            branching += 1
+        depth += 1
+    
+    tasks = mp.Queue()
+    results = mp.Queue()
+    stop = mp.Event()
+    lock = mp.Lock()
+    outstanding = mp.Value('i', 0, lock=False) # subproblems queued or being searched
+    idle = mp.Value('i', 0, lock=False) # workers waiting for a subproblem
+    
+    prefixes = list(product(*[range(len(c['intervals'])) for c in c2[:depth]]))
+    outstanding.value = len(prefixes)
+    for prefix in prefixes:
+        tasks.put(prefix)
+    
+    processes = [
+        mp.Process(target=worker, args=(c2, tasks, results, stop, lock, outstanding, idle, deadline, cancel))
+        for _ in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    
+    X = None
+    for key in ['total', 'consistent', 'dead', 'backjump', 'tasks', 'donated', 'expired']:
+        stats[key] = 0
+    
+    finished = 0
+    while finished < len(processes):
+        try:
+            kind, value = results.get(timeout=0.1)
+        except Empty:
+            if any(p.exitcode not in (None, 0) for p in processes):
+                stop.set() # a worker died, its subproblems are lost, so the others would wait for them forever
+            if not any(p.is_alive() for p in processes) and results.empty():
+                break
+            continue
+        
+        if kind == 'solution':
+            if X is None:
+                X = value
+                stop.set()
+        else:
+            finished += 1
+            for key in value:
+                stats[key] += value[key]
+    
+    for p in processes:
+        p.join()
+    stats['lost'] = len(processes) - finished # workers which died without reporting
+    
+    if X is not None:
+        stats['status'] = SAT
+        stats['consistent'] = 1
+    elif stats['expired'] or stats['lost']:
+        stats['status'] = UNKNOWN
+        if verbose: print('UNKNOWN')
+    else:
+        stats['status'] = UNSAT
+        if verbose: print('UNSAT')
+    return X
+
+def worker(constraints, tasks, results, stop, lock, outstanding, idle, deadline=None, cancel=None):
+    """
+    Worker process loop: searches subproblems until all are exhausted, a solution was found, or time ran out.
+    Sends ('solution', X) when it finds one, and ('stats', stats) before it exits,
+    stats['expired'] being 1 if it stopped because of the deadline or cancellation.
+    """
+    
+    tasks.cancel_join_thread() # do not block on exit over donations nobody will take
+    stats = {'total': 0, 'consistent': 0, 'dead': 0, 'backjump': 0, 'tasks': 0, 'donated': 0, 'expired': 0}
+    waiting = False
+    
+    while not stop.is_set():
+        if expired(deadline, cancel):
+            stats['expired'] = 1
+            break
+        
+        try:
+            prefix = tasks.get(timeout=0.01)
+        except Empty:
+            with lock:
+                if not waiting:
+                    waiting = True
+                    idle.value += 1
+                if outstanding.value == 0:
+                    break
+            continue
+        
+        if waiting:
+            with lock:
+                waiting = False
+                idle.value -= 1
+        
+        stats['tasks'] += 1
+        X = search_subproblem(constraints, list(prefix), tasks, stop, lock, outstanding, idle, stats, deadline, cancel)
+        with lock:
+            outstanding.value -= 1
+        
+        if X is not None:
+            results.put( ('solution', X) )
+            stop.set()
+    
+    results.put( ('stats', stats) )
+
+def search_subproblem(constraints, prefix, tasks, stop, lock, outstanding, idle, stats,
+                      deadline=None, cancel=None, check_every=64):
+    """
+    Backtracking search over the constraints after a fixed prefix of interval selections.
+    Returns None or a particular valid assignment list.
+    """
+    
+    base = len(prefix)
+    d_graph = discrete_graph(max([max(t['i'], t['j']) for t in constraints]) + 1)
+    trail = []
+    
+    for k in range(base):
+        stats['total'] += 1
+        if not add_constraint(d_graph, constraints[k], constraints[k]['intervals'][prefix[k]], trail):
+            stats['dead'] += 1
+            return None
+    
+    i = base
+    selection = prefix + [None for _ in range(len(constraints) - base)]
+    limit = [len(c['intervals']) for c in constraints] # values from limit[k] on were donated
+    marks = [0 for _ in range(len(constraints))]
+    
+    while base <= i < len(constraints):
+        stats['total'] += 1
+        if stats['total'] % check_every == 0:
+            if stop.is_set() or expired(deadline, cancel):
+                return None
+            if idle.value > 0:
+                donate(constraints, base, i, selection, limit, tasks, lock, outstanding, stats)
+        
+        select_value_bounded(constraints, i, selection, limit, d_graph, trail, marks)
+        if selection[i] is None:
+            stats['dead'] += 1
+            stats['backjump'] += 1
+            i -= 1
+        else:
+            i = i + 1
+            if i < len(constraints):
+                selection[i] = None
+    
+    if i < base:
+        return None
+    return get_min_sol(d_graph)
+
+def select_value_bounded(constraints, i, selection, limit, d_graph, trail, marks):
+    """
+    Same as exact_solver.select_value, but only tries interval indices below limit[i].
+    """
+    
+    intervals = constraints[i]['intervals']
+    
+    if selection[i] is None:
+        selection[i] = -1
+        marks[i] = len(trail)
+    
+    while selection[i] + 1 < limit[i]:
+        undo(d_graph, trail, marks[i])
+        selection[i] += 1
+        if add_constraint(d_graph, constraints[i], intervals[selection[i]], trail):
+            return
+    
+    undo(d_graph, trail, marks[i])
+    selection[i] = None
+    limit[i] = len(intervals)
+
+def donate(constraints, base, i, selection, limit, tasks, lock, outstanding, stats):
+    """
+    Gives away the untried intervals at the shallowest open level below i as new subproblems.
+    """
+    
+    for level in range(base, i):
+        if selection[level] + 1 < limit[level]:
+            new = [tuple(selection[:level]) + (v,) for v in range(selection[level] + 1, limit[level])]
+            limit[level] = selection[level] + 1
+            
+            with lock:
+                outstanding.value += len(new)
+            for prefix in new:
+                tasks.put(prefix)
+            stats['donated'] += len(new)
+            return
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+import multiprocessing as mp
+from queue import Empty
+from time import monotonic
+
+from verifier import verify_witness
+
+EXACT_STRATEGIES = ['bt', 'gbj', 'cbj', 'dynamic', 'fc']
+
+def run_strategy(T, strategy, kwargs):
+    """
+    Runs a single strategy on T, in a worker process.
+    Returns (strategy, status, witness) where status is 'SAT', 'UNSAT' or 'UNKNOWN'.
+    """
+    
+    if strategy in EXACT_STRATEGIES:
+        from exact_solver import solve
+        stats = {}
+        X = solve(T, strategy=strategy, stats=stats, **kwargs)
+        # None is only a proof when the search was not stopped early
+        return strategy, stats['status'], X
+    
+    elif strategy == 'meta_walk':
+        from genetic_meta import close_gene, meta_walk, update_graph
+        from exact_solver import discrete_graph, get_min_sol
+        
+        kwargs = {'max_iterations': 100, 'max_flips': 50, **kwargs}
+        selection, failed = meta_walk(T, **kwargs)
+        num_variables = max([max(t['i'], t['j']) for t in T])
+        gene = [selection, discrete_graph(num_variables+1), None, None]
+        update_graph(gene, T)
+        X = get_min_sol(close_gene(gene)) # the witness meta_walk scored
+    
+    elif strategy == 'direct_walk':
+        from genetic_direct import direct_walk
+        
+        kwargs = {'r': 100, 'max_iterations': 100, 'max_flips': 50, 'pick_best_gene': True, **kwargs}
+        X, failed = direct_walk(T, **kwargs)
+    
+    else:
+        raise ValueError(f'unknown strategy: {strategy}')
+    
+    # incomplete strategies never prove anything, only their witnesses count
+    return strategy, 'SAT' if not failed else 'UNKNOWN', X
+
+def portfolio_solve(T, strategies=None, timeout=None, verbose=False):
+    """
+    Runs several solvers on T in parallel, one process per strategy, and returns as soon as one of them settles it.
+    Returns (status, witness, strategy):
+      ('SAT', X, strategy) for the first witness that passes verify_witness,
+      ('UNSAT', None, strategy) for the first exact strategy proving unsatisfiability,
+      ('UNKNOWN', None, None) if every strategy gave up or the timeout was hit.
+    
+    Arguments:
+    T -- the constraint problem
+    strategies -- list of strategy names or (name, kwargs) pairs, out of EXACT_STRATEGIES,
+                  'meta_walk' and 'direct_walk' (defaults to ['cbj', 'dynamic', 'meta_walk', 'direct_walk'])
+    timeout -- seconds to wait before giving up, or None to wait for all strategies
+    """
+    
+    if strategies is None:
+        strategies = ['cbj', 'dynamic', 'meta_walk', 'direct_walk']
+    strategies = [(s, {}) if isinstance(s, str) else s for s in strategies]
+    
+    deadline = None if timeout is None else monotonic() + timeout
+    results = mp.Queue()
+    processes = [mp.Process(target=portfolio_worker, args=(T, name, kwargs, results)) for name, kwargs in strategies]
+    for p in processes:
+        p.start()
+    
+    pending = len(processes)
+    result = ('UNKNOWN', None, None)
+    
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                if verbose: print('portfolio timed out')
+                break
+            
+            try:
+                strategy, status, X = results.get(timeout=0.1 if remaining is None else min(remaining, 0.1))
+            except Empty:
+                if not any(p.is_alive() for p in processes) and results.empty():
+                    if verbose: print('portfolio workers exited without a result')
+                    break
+                continue
+            pending -= 1
+            if verbose: print(strategy, status)
+            
+            if status == 'SAT' and not verify_witness(X, T):
+                result = ('SAT', X, strategy)
+                break
+            elif status == 'UNSAT':
+                result = ('UNSAT', None, strategy)
+                break
+    finally:
+        # the remaining strategies are still running, stop them
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+        for p in processes:
+            p.join()
+    
+    return result
+
+def portfolio_worker(T, strategy, kwargs, results):
+    """
+    Worker process: runs a strategy and sends its (strategy, status, witness) on the results queue.
+    """
+    
+    results.put(run_strategy(T, strategy, kwargs))
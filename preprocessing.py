@@ -1,28 +1,50 @@
 #!/usr/bin/python3
+from intervals import IntervalSet, interval_set
+
+# preprocessing assumes integer solutions, so intervals less than 1 apart are merged (see cleanup_intervals)
+GAP = 1
 
 def intersect(I, J):
     """
     Returns the intersection of intervals given by lists I and J
     Remark: both lists have to be of the form of ordered disjoint intervals.
+    (Returns an IntervalSet if either argument is one, else a list.)
     """
     
-    # TODO fix this merge, experimental
-    return cleanup_intervals([
-        [max(first[0], second[0]), min(first[1], second[1])] 
-        for first in I for second in J
-        if max(first[0], second[0]) <= min(first[1], second[1])
-    ])
+    return as_input_type(interval_set(I, GAP).intersect(interval_set(J, GAP), GAP), I, J)
+    
+def loose_intersect(I, J):
+    """
+    Returns the loose intersection of interval lists I and J:
+    every interval of I is shrunk to the smallest interval containing its intersection with J,
+    (and dropped if it is empty) so the result never has more intervals than I.
+    """
+    
+    J = interval_set(J, GAP)
+    ret = []
+    for interval in I:
+        inter = IntervalSet([interval]).intersect(J, GAP)
+        if inter:
+            ret.append( (inter[0][0], inter[-1][1]) )
+    return as_input_type(IntervalSet(ret, GAP), I, J)
     
 def compose(I, J):
     """
     Returns the composition of interval lists I and J.
     Remark: both lists have to be of the form of ordered disjoint intervals.
+    (Returns an IntervalSet if either argument is one, else a list.)
     """
 
-    return cleanup_intervals([
-        (i[0] + j[0], i[1] + j[1])
-        for i in I for j in J
-    ])
+    return as_input_type(interval_set(I, GAP).compose(interval_set(J, GAP), GAP), I, J)
+
+def as_input_type(ret, I, J):
+    """
+    Returns the IntervalSet 'ret' as a list, unless I or J were IntervalSets.
+    """
+    
+    if isinstance(I, IntervalSet) or isinstance(J, IntervalSet):
+        return ret
+    return ret.to_list()
 
 def cleanup_intervals(I):
     """
@@ -39,24 +61,78 @@ def cleanup_intervals(I):
     
     return [(a, b) for a, b in ret]
 
+def cap_intervals(I, budget, stats=None, edge=None):
+    """
+    Returns I over-approximated by at most 'budget' intervals (merging across the smallest gaps),
+    or I itself if it is within budget or there is no budget.
+    Merges are counted in stats['merges'], and the edge is added to stats['approximate_edges'].
+    """
+    
+    if budget is None or len(I) <= budget:
+        return I
+    
+    capped, merges = interval_set(I, GAP).cap(budget)
+    if stats is not None:
+        stats['merges'] += merges
+        stats['approximate'] = True
+        stats['approximate_edges'].add(edge)
+    return as_input_type(capped, I, I)
+
+def fragmentation_stats(stats):
+    """
+    Resets the fragmentation budget counters in 'stats', if given.
+    """
     
-def PC_1(T, verbose=False):
+    if stats is not None:
+        stats['merges'] = 0 # gaps filled to keep within budget
+        stats['approximate'] = False # whether any edge is an over-approximation
+        stats['approximate_edges'] = set()
+
+def reverse_intervals(I):
     """
-    Applies the PC-1 algorithm onto the constraints given by T.
-    Returns 
+    Returns the intervals of X_i - X_j given the intervals I of X_j - X_i.
+    """
+    
+    if isinstance(I, IntervalSet):
+        return I.reverse()
+    
+    # we take each interval (a,b) and convert it into (-b,-a)
+    # note we want to also reverse the order of all intervals so that it is again increasing
+    return [(-b, -a) for a, b in reversed(I)]
+
+def constraint_matrix(T, num_variables):
+    """
+    Returns the constraints T in adjacency matrix form, mat[i][j] being the IntervalSet of X_j - X_i
+    (None where there is no constraint).
     """
     
-    # set up constraints into adj matrix form
-    num_variables = max([max(t['i'], t['j']) for t in T]) + 1
     mat = [ [ None for i in range(num_variables) ] for j in range(num_variables) ]
     for constr in T:
-        i, j, intervals = constr['i'], constr['j'], constr['intervals']
+        i, j, intervals = constr['i'], constr['j'], interval_set(constr['intervals'], GAP)
         
         mat[i][j] = intervals
-        mat[j][i] = [(-b, -a) for a, b in reversed(intervals)]
-        # ^ for reverse, we take each interval (a,b) and convert it into (-b,-a)
-        #   note we want to also reverse the order of all intervals so that it is again increasing
-        
+        mat[j][i] = reverse_intervals(intervals)
+    
+    return mat
+
+    
+def PC_1(T, verbose=False, budget=None, stats=None):
+    """
+    Applies the PC-1 algorithm onto the constraints given by T.
+    Returns 
+    
+    Arguments:
+    budget -- if set, compositions with more intervals than this are over-approximated by merging their
+              closest intervals, the result is then approximate (sound, but not path consistent)
+    stats -- optional dict, filled with the number of 'merges', whether the result is 'approximate',
+             and the 'approximate_edges'
+    """
+    
+    fragmentation_stats(stats)
+    
+    # set up constraints into adj matrix form
+    num_variables = max([max(t['i'], t['j']) for t in T]) + 1
+    mat = constraint_matrix(T, num_variables)
     
     # actual PC-1 core algorithm:
     changed = True
@@ -67,15 +143,15 @@ def PC_1(T, verbose=False):
                 for j in range(num_variables):
                     # T_ij = T_ij + T_ik x T_kj
 
-                    if mat[i][k] == None or mat[k][j] == None:
+                    if mat[i][k] is None or mat[k][j] is None:
                         # if we cannot compose
                         continue
-                    elif mat[i][j] == None:
+                    elif mat[i][j] is None:
                         # if unset it means no constraint, so only compose
-                        mat[i][j] = compose(mat[i][k], mat[k][j])
+                        mat[i][j] = cap_intervals(compose(mat[i][k], mat[k][j]), budget, stats, (min(i, j), max(i, j)))
                     else:
                         # intersect&compose
-                        op = intersect(mat[i][j], compose(mat[i][k], mat[k][j]))
+                        op = intersect(mat[i][j], cap_intervals(compose(mat[i][k], mat[k][j]), budget, stats, (min(i, j), max(i, j))))
                         if mat[i][j] != op:
                             mat[i][j] = op
                             changed = True
@@ -89,5 +165,262 @@ def PC_1(T, verbose=False):
     for i in range(num_variables):
         for j in range(i, num_variables):
             if mat[i][j]:
-                S += [{'i': i, 'j': j, 'intervals': mat[i][j]}]
-    return S
\ No newline at end of file
+                S += [{'i': i, 'j': j, 'intervals': mat[i][j].to_list()}]
+    return S
+
+
+def PC_2(T, verbose=False, max_intervals=None, budget=None, stats=None):
+    """
+    Applies a PC-2 style path consistency algorithm onto the constraints given by T.
+    Instead of sweeping every triangle until nothing changes, a worklist keeps the edges that changed,
+    and only the triangles containing one of them are revised.
+    Returns the tightened constraints in the same form as PC_1 (without the i == j entries),
+    or None if unsatisfiability was deduced.
+    
+    Arguments:
+    T -- the constraint problem
+    max_intervals -- if set, revisions that would leave more intervals than this on an edge are skipped,
+                     bounding the fragmentation (the result is then less tight, but still sound)
+    budget, stats -- fragmentation budget on compositions, see PC_1
+    """
+    
+    fragmentation_stats(stats)
+    num_variables = max([max(t['i'], t['j']) for t in T]) + 1
+    mat = constraint_matrix(T, num_variables)
+    
+    edges = [
+        (i, j) for i in range(num_variables) for j in range(i+1, num_variables)
+        if mat[i][j] is not None
+    ]
+    others = lambda i, j: (k for k in range(num_variables) if k != i and k != j)
+    if not propagate(mat, edges, others, max_intervals, budget=budget, stats=stats):
+        if verbose: print('Unsatisfiability deduced at the PC-2 level.')
+        return None
+    
+    # convert back to standard form used elsewhere:
+    S = []
+    for i in range(num_variables):
+        for j in range(i+1, num_variables):
+            if mat[i][j] is not None:
+                S += [{'i': i, 'j': j, 'intervals': mat[i][j].to_list()}]
+    return S
+
+def PPC(T, verbose=False, heuristic='min-fill', max_intervals=None, budget=None, stats=None):
+    """
+    Applies partial path consistency onto the constraints given by T.
+    The constraint graph is triangulated (made chordal), and path consistency is only enforced
+    on the triangles of the chordal graph, so sparse networks stay sparse:
+    memory is proportional to the edges, and work to the triangles.
+    Returns the tightened constraints on the edges of the chordal graph, in the same form as PC_2,
+    or None if unsatisfiability was deduced.
+    
+    Arguments:
+    T -- the constraint problem
+    heuristic -- elimination order used to triangulate, 'min-fill' or 'min-degree'
+    max_intervals -- see PC_2
+    budget, stats -- fragmentation budget on compositions, see PC_1
+    """
+    
+    fragmentation_stats(stats)
+    # sparse adjacency form, labels[i][j] are the intervals of X_j - X_i
+    labels = {}
+    for constr in T:
+        i, j, intervals = constr['i'], constr['j'], constr['intervals']
+        if i == j:
+            # X_i - X_i = 0, so these only matter when they exclude 0
+            if not any(a <= 0 <= b for a, b in intervals):
+                if verbose: print('Unsatisfiability deduced at the PPC level.')
+                return None
+            continue
+        
+        intervals = interval_set(intervals, GAP)
+        labels.setdefault(i, {})[j] = intervals
+        labels.setdefault(j, {})[i] = reverse_intervals(intervals)
+    
+    neighbours = {v: set(labels[v]) for v in labels}
+    for a, b in triangulate(neighbours, heuristic):
+        # fill edges start out unconstrained
+        labels[a][b] = None
+        labels[b][a] = None
+    
+    edges = [
+        (i, j) for i in labels for j in labels[i]
+        if i < j and labels[i][j] is not None
+    ]
+    common = lambda i, j: neighbours[i] & neighbours[j]
+    if not propagate(labels, edges, common, max_intervals, budget=budget, stats=stats):
+        if verbose: print('Unsatisfiability deduced at the PPC level.')
+        return None
+    
+    return [
+        {'i': i, 'j': j, 'intervals': labels[i][j].to_list()}
+        for i in sorted(labels) for j in sorted(labels[i])
+        if i < j and labels[i][j] is not None
+    ]
+
+def triangulate(neighbours, heuristic='min-fill'):
+    """
+    Makes the graph given by the 'neighbours' adjacency sets chordal, by simulating vertex elimination
+    in min-fill or min-degree order and adding the fill edges to 'neighbours'.
+    Returns the list of fill edges.
+    """
+    
+    from itertools import combinations
+    
+    def fill_in(v):
+        return sum(1 for a, b in combinations(remaining[v], 2) if b not in remaining[a])
+    
+    remaining = {v: set(neighbours[v]) for v in neighbours}
+    fill = []
+    while remaining:
+        if heuristic == 'min-degree':
+            v = min(remaining, key=lambda v: (len(remaining[v]), v))
+        elif heuristic == 'min-fill':
+            v = min(remaining, key=lambda v: (fill_in(v), len(remaining[v]), v))
+        else:
+            raise ValueError(f'unknown heuristic: {heuristic}')
+        
+        for a, b in combinations(sorted(remaining[v]), 2):
+            if b not in remaining[a]:
+                remaining[a].add(b)
+                remaining[b].add(a)
+                neighbours[a].add(b)
+                neighbours[b].add(a)
+                fill.append( (a, b) )
+        
+        for u in remaining[v]:
+            remaining[u].discard(v)
+        del remaining[v]
+    
+    return fill
+
+def propagate(mat, edges, common, max_intervals=None, loose=False, budget=None, stats=None):
+    """
+    Worklist-driven path consistency shared by PC_2, PPC and LPC.
+    Starting from the given edges, revises the triangles (i, j, k) through every changed edge (i, j),
+    for k in common(i, j), until nothing changes.
+    Returns False if an edge became empty (unsatisfiable), True otherwise.
+    """
+    
+    from collections import deque
+    
+    queue = deque(edges)
+    in_queue = set(queue)
+    
+    while queue:
+        i, j = queue.popleft()
+        in_queue.discard( (i, j) )
+        
+        for k in common(i, j):
+            # T_ik = T_ik + T_ij x T_jk, and T_kj = T_kj + T_ki x T_ij
+            for a, m, b in ((i, j, k), (k, i, j)):
+                if not revise(mat, a, m, b, max_intervals, loose, budget, stats):
+                    continue
+                
+                if not mat[a][b]:
+                    return False
+                
+                edge = (min(a, b), max(a, b))
+                if edge not in in_queue:
+                    in_queue.add(edge)
+                    queue.append(edge)
+    
+    return True
+
+def revise(mat, a, m, b, max_intervals=None, loose=False, budget=None, stats=None):
+    """
+    Tightens mat[a][b] (and mat[b][a]) to T_ab + T_am x T_mb,
+    or to the loose intersection of T_ab with T_am x T_mb if 'loose'.
+    The composition is capped to 'budget' intervals, see PC_1.
+    Returns whether the edge changed.
+    """
+    
+    if mat[a][m] is None or mat[m][b] is None:
+        return False
+    
+    op = cap_intervals(compose(mat[a][m], mat[m][b]), budget, stats, (min(a, b), max(a, b)))
+    if loose:
+        op = loose_intersect(mat[a][b], op) if mat[a][b] is not None else IntervalSet([(op[0][0], op[-1][1])])
+    elif mat[a][b] is not None:
+        op = intersect(mat[a][b], op)
+    
+    if op == mat[a][b]:
+        return False
+    if max_intervals is not None and op and len(op) > max_intervals:
+        return False
+    
+    mat[a][b] = op
+    mat[b][a] = reverse_intervals(op)
+    return True
+
+def ULT(T, verbose=False):
+    """
+    Applies Upper-Lower Tightening onto the constraints given by T.
+    Each constraint is relaxed to its [lowest, highest] envelope, the resulting STP is closed,
+    and every constraint is intersected with the bounds of the closed STP, until nothing changes.
+    Polynomial, and never fragments intervals.
+    Returns the tightened constraints in the same form as PC_2, or None if unsatisfiability was deduced.
+    """
+    
+    from exact_solver import add_constraint, discrete_graph
+    
+    num_variables = max([max(t['i'], t['j']) for t in T]) + 1
+    mat = constraint_matrix(T, num_variables)
+    edges = [
+        (i, j) for i in range(num_variables) for j in range(i+1, num_variables)
+        if mat[i][j] is not None
+    ]
+    
+    if any(mat[i][i] is not None and not mat[i][i].contains(0) for i in range(num_variables)):
+        if verbose: print('Unsatisfiability deduced at the ULT level.')
+        return None
+    
+    changed = True
+    while changed:
+        changed = False
+        
+        d_graph = discrete_graph(num_variables)
+        for i, j in edges:
+            envelope = (mat[i][j][0][0], mat[i][j][-1][1])
+            if not add_constraint(d_graph, {'i': i, 'j': j}, envelope):
+                if verbose: print('Unsatisfiability deduced at the ULT level.')
+                return None
+        
+        for i, j in edges:
+            op = intersect(mat[i][j], IntervalSet([(-d_graph[j][i], d_graph[i][j])]))
+            if not op:
+                if verbose: print('Unsatisfiability deduced at the ULT level.')
+                return None
+            if op != mat[i][j]:
+                mat[i][j] = op
+                mat[j][i] = reverse_intervals(op)
+                changed = True
+    
+    return [{'i': i, 'j': j, 'intervals': mat[i][j].to_list()} for i, j in edges]
+
+def LPC(T, verbose=False):
+    """
+    Applies Loose Path Consistency onto the constraints given by T.
+    Like PC_2, but every revision uses the loose intersection, so an edge never gets more intervals than it had
+    (edges without a constraint get the envelope of the composition).
+    Returns the tightened constraints in the same form as PC_2, or None if unsatisfiability was deduced.
+    """
+    
+    num_variables = max([max(t['i'], t['j']) for t in T]) + 1
+    mat = constraint_matrix(T, num_variables)
+    
+    edges = [
+        (i, j) for i in range(num_variables) for j in range(i+1, num_variables)
+        if mat[i][j] is not None
+    ]
+    others = lambda i, j: (k for k in range(num_variables) if k != i and k != j)
+    if not propagate(mat, edges, others, loose=True):
+        if verbose: print('Unsatisfiability deduced at the LPC level.')
+        return None
+    
+    S = []
+    for i in range(num_variables):
+        for j in range(i+1, num_variables):
+            if mat[i][j] is not None:
+                S += [{'i': i, 'j': j, 'intervals': mat[i][j].to_list()}]
+    return S
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+from exact_solver import solve
+
+# X_1 in [0, 1] or [2, 6] and X_2 = X_1 = 1.5: unsatisfiable, though the gap between both intervals is under 1
+GAP_UNDER_ONE = [
+    {'i': 0, 'j': 1, 'intervals': [(0, 1), (2, 6)]},
+    {'i': 0, 'j': 2, 'intervals': [(1.5, 1.5)]},
+    {'i': 1, 'j': 2, 'intervals': [(0, 0)]},
+]
+
+def test_forward_checking_agrees_with_backtracking():
+    bt_stats, fc_stats = {}, {}
+    assert solve(GAP_UNDER_ONE, strategy='bt', stats=bt_stats) is None
+    assert solve(GAP_UNDER_ONE, strategy='fc', stats=fc_stats) is None
+    assert fc_stats['status'] == bt_stats['status'] == 'UNSAT'
+
+def test_preprocessed_solutions_satisfy_the_constraints():
+    from preprocessing import PC_2, PPC, ULT, LPC
+    
+    for preprocess in [PC_2, PPC, ULT, LPC]:
+        stats = {}
+        assert solve(GAP_UNDER_ONE, strategy='bt', stats=stats, preprocess=preprocess) is None
+        assert stats['status'] == 'UNSAT'
+
+def brute_force_network(constraints):
+    from itertools import product
+    from exact_solver import INF, consistent, discrete_graph, generate_d_graph
+    from intervals import IntervalSet
+    
+    N = max([max(t['i'], t['j']) for t in constraints]) + 1
+    labels = {}
+    for selection in product(*[c['intervals'] for c in constraints]):
+        graph = discrete_graph(N)
+        for c, (a, b) in zip(constraints, selection):
+            graph[c['i']][c['j']] = min(graph[c['i']][c['j']], b)
+            graph[c['j']][c['i']] = min(graph[c['j']][c['i']], -a)
+        d_graph = generate_d_graph(graph)
+        if not consistent(d_graph):
+            continue
+        for i in range(N):
+            for j in range(i+1, N):
+                if d_graph[i][j] < INF and d_graph[j][i] < INF:
+                    labels.setdefault((i, j), []).append( (-d_graph[j][i], d_graph[i][j]) )
+    return {pair: IntervalSet(label).to_list() for pair, label in labels.items()}
+
+def test_minimal_network_matches_brute_force_on_real_values():
+    import random
+    from exact_solver import minimal_network
+    from problem_generator import generate_problem
+    
+    for seed in range(10):
+        random.seed(seed)
+        T = generate_problem(variables=5, constraint_probability=0.5, max_intervals=3)
+        for c in T:
+            c['intervals'] = [(a / 8, b / 8) for a, b in c['intervals']] # gaps under 1, exact sums
+        
+        network = minimal_network(T, stats={})
+        expected = brute_force_network(T)
+        if network is None:
+            assert not expected
+        else:
+            assert {(c['i'], c['j']): c['intervals'] for c in network} == expected
@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+from genetic_direct import best_move, direct_tabu, move_gain, walk_state
+
+def test_touching_intervals_count_once():
+    T = [{'i': 0, 'j': 1, 'intervals': [(-26, -25), (-25, -18)]}]
+    state = walk_state([0, 10], T)
+    top, value = best_move(state, T, 1)
+    assert top == 1
+    assert -26 <= value <= -18
+
+def test_satisfied_variable_has_no_gain():
+    # X_1 already satisfies both constraints on it, one being with itself
+    T = [
+        {'i': 0, 'j': 1, 'intervals': [(-26, -25), (-25, -18)]},
+        {'i': 1, 'j': 1, 'intervals': [(0, 0)]},
+    ]
+    state = walk_state([0, -25], T)
+    assert move_gain(state, T, 1)[0] == 0
+
+def test_tabu_solves_touching_intervals():
+    T = [
+        {'i': 0, 'j': 1, 'intervals': [(-26, -25), (-25, -18)]},
+        {'i': 1, 'j': 2, 'intervals': [(3, 4), (4, 9)]},
+        {'i': 0, 'j': 2, 'intervals': [(-20, -10)]},
+    ]
+    stats = {}
+    gene, failed = direct_tabu(T, 100, 1000, noise=0, stats=stats)
+    assert failed == [] and stats['status'] == 'SAT'
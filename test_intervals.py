@@ -0,0 +1,9 @@
+#!/usr/bin/python3
+from intervals import IntervalSet
+
+def test_equal_sets_hash_equal_across_typecodes():
+    a, b = IntervalSet([(0, 1)]), IntervalSet([(0.0, 1.0)])
+    assert a == b
+    assert hash(a) == hash(b)
+    assert a == b
+    assert len({a, b}) == 1
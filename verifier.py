@@ -1,4 +1,7 @@
 #!/usr/bin/python3
+import numpy as np
+
+from intervals import IntervalSet
 
 def verify_witness(X, T):
     """
@@ -17,13 +20,65 @@ def verify_witness(X, T):
 
         diff = X[j] - X[i]
 
-        passed = False
-        for interval in constraint['intervals']:
-            if interval[0] <= diff <= interval[1]:
-                passed = True
-                break
+        intervals = constraint['intervals']
+        if isinstance(intervals, IntervalSet):
+            passed = intervals.contains(diff)
+        else:
+            passed = False
+            for interval in intervals:
+                if interval[0] <= diff <= interval[1]:
+                    passed = True
+                    break
         
         if not passed:
             failed_constraints += [constraint]
 
-    return failed_constraints
\ No newline at end of file
+    return failed_constraints
+
+def compile_problem(T):
+    """
+    Compiles problem T into the array form used by verify_batch.
+    Returns a dict with
+      'i', 'j' -- (M,) arrays of the constraint endpoints
+      'lows', 'highs' -- (M, K) arrays of interval endpoints, K being the most intervals on a constraint,
+                         shorter rows are padded with empty intervals (inf, -inf)
+    """
+    
+    K = max([len(constraint['intervals']) for constraint in T] + [1])
+    lows = np.full((len(T), K), np.inf)
+    highs = np.full((len(T), K), -np.inf)
+    for k, constraint in enumerate(T):
+        for l, (a, b) in enumerate(constraint['intervals']):
+            lows[k, l] = a
+            highs[k, l] = b
+    
+    return {
+        'i': np.array([constraint['i'] for constraint in T], dtype=int),
+        'j': np.array([constraint['j'] for constraint in T], dtype=int),
+        'lows': lows,
+        'highs': highs,
+    }
+
+def verify_batch(X, compiled, masks=False):
+    """
+    Verify a whole batch of assignments at once.
+    Returns the number of failed constraints of each assignment,
+    and if 'masks', also the boolean (B, M) matrix of which constraints each assignment fails.
+    
+    Arguments:
+    X -- (B, N) matrix of assignments, row b being an assignment like in verify_witness
+    compiled -- the problem, compiled with compile_problem (a plain problem is compiled on the fly)
+    masks -- whether to also return the failure masks
+    """
+    
+    if not isinstance(compiled, dict):
+        compiled = compile_problem(compiled)
+    
+    X = np.asarray(X)
+    diff = (X[:, compiled['j']] - X[:, compiled['i']])[:, :, None]
+    passed = ((compiled['lows'] <= diff) & (diff <= compiled['highs'])).any(axis=2)
+    failed = ~passed
+    
+    if masks:
+        return failed.sum(axis=1), failed
+    return failed.sum(axis=1)